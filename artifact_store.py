@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+from contextlib import contextmanager
+from deadline import REQUEST_TIMEOUT
+from file_lock import locked
+from metrics import inc, log
+
+# Bump when exporter output for the same input changes (scale, PPTX layout, ...).
+ARTIFACT_VERSION = 3
+
+# Scratch directories and unindexed blobs younger than this may belong to an export
+# still running in another server process on the same store, so they are left alone.
+ORPHAN_GRACE_S = max(3600.0, 2 * REQUEST_TIMEOUT)
+
+
+def artifact_key(markdown: str, theme_key: str, style_class: str, fmt: str, images_key: str = ""):
+    """
+    Content address of one exported format: final deck Markdown, theme CSS, class,
+    format and the content of the local images it shows (assets.content_key).
+    """
+    payload = json.dumps([ARTIFACT_VERSION, theme_key, style_class, fmt, images_key, markdown],
+                         ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ArtifactStore:
+    """
+    Exported decks keyed by artifact_key(), so identical requests reuse the
+    existing PPTX/PDF/PNG files instead of exporting again.
+
+    Blobs live under `root/objects/<key>/`; the title-named files in
+    output_slides are hard links to them (copies where links are not
+    supported), swapped in atomically so a later export never writes through
+    a stored blob. An index of sizes and last use drives eviction: least
+    recently used entries go first once the store exceeds `max_bytes`, and
+    entries unused for `max_age` seconds are dropped. `max_bytes` bounds the
+    store only: a title file still linked to an evicted blob keeps its data on
+    disk until the file is replaced or deleted.
+
+    Several server processes may share one store (every stdio client starts its
+    own), so each change re-reads the index under a file lock before writing it.
+    """
+
+    def __init__(self, root, max_bytes=1024 * 1024 * 1024, max_age=30 * 86400):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._objects = os.path.join(root, "objects")
+        self._index_path = os.path.join(root, "index.json")
+        self._lock_path = os.path.join(root, "index.lock")
+        self._index = {}
+        os.makedirs(self._objects, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def from_env(cls, base_dir):
+        """None when MARP_ARTIFACT_STORE=0, so every request exports into output_slides directly."""
+        if os.environ.get("MARP_ARTIFACT_STORE", "1") == "0":
+            return None
+        return cls(
+            os.environ.get("MARP_ARTIFACT_DIR") or os.path.join(base_dir, "output_slides", ".artifacts"),
+            max_bytes=int(float(os.environ.get("MARP_ARTIFACT_MAX_MB", "1024")) * 1024 * 1024),
+            max_age=float(os.environ.get("MARP_ARTIFACT_MAX_AGE_S", str(30 * 86400))),
+        )
+
+    @contextmanager
+    def _locked(self):
+        """Hold the store's file lock and work on a fresh copy of the index."""
+        with locked(self._lock_path):
+            self._read_index()
+            yield
+
+    def _read_index(self):
+        try:
+            with open(self._index_path, encoding="utf-8") as f:
+                self._index = json.load(f)
+        except (OSError, ValueError):
+            self._index = {}
+
+    def _load(self):
+        now = time.time()
+        with self._locked():
+            # Drop index entries whose blobs are gone and old blobs the index does not
+            # know (left behind by a crash between moving files in and saving the index).
+            for key in list(self._index):
+                if not os.path.isdir(os.path.join(self._objects, key)):
+                    del self._index[key]
+            self._remove_stale(self._objects, now, keep=self._index)
+            self._remove_stale(os.path.join(self.root, "tmp"), now)
+            self._save()
+            self._evict()
+
+    @staticmethod
+    def _remove_stale(directory, now, keep=()):
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                stale = name not in keep and now - os.path.getmtime(path) > ORPHAN_GRACE_S
+            except OSError:
+                continue
+            if stale:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _save(self):
+        temp_path = self._index_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(temp_path, self._index_path)
+
+    def _blobs(self, key):
+        entry = self._index[key]
+        return [os.path.join(self._objects, key, name) for name in entry["files"]]
+
+    def lookup(self, key):
+        """Blob paths stored for `key` (marking it used), or None."""
+        with self._locked():
+            return self._lookup(key)
+
+    def _lookup(self, key):
+        entry = self._index.get(key)
+        if entry is None:
+            self.misses += 1
+            inc("marp_artifact_lookups_total", result="miss")
+            return None
+        entry["last_used"] = time.time()
+        self._save()
+        self.hits += 1
+        inc("marp_artifact_lookups_total", result="hit")
+        return self._blobs(key)
+
+    def scratch_dir(self):
+        """A fresh directory on the store's filesystem to export into before put()."""
+        path = os.path.join(self.root, "tmp", uuid.uuid4().hex[:12])
+        os.makedirs(path)
+        return path
+
+    def put(self, key, fmt, paths):
+        """Move freshly exported files into the store under `key` and return their blob paths."""
+        with self._locked():
+            if key in self._index:
+                # Another request exported the same deck meanwhile; keep the stored copy.
+                return self._lookup(key)
+            entry_dir = os.path.join(self._objects, key)
+            os.makedirs(entry_dir, exist_ok=True)
+            files = []
+            size = 0
+            for n, path in enumerate(paths):
+                name = f"{n:03d}{os.path.splitext(path)[1]}"
+                os.replace(path, os.path.join(entry_dir, name))
+                size += os.path.getsize(os.path.join(entry_dir, name))
+                files.append(name)
+            now = time.time()
+            self._index[key] = {"format": fmt, "files": files, "size": size, "created": now, "last_used": now}
+            self._save()
+            self._evict(keep=key)
+            return self._blobs(key)
+
+    def materialize(self, blobs, paths):
+        """Point each of `paths` at the matching blob, replacing whatever file was there."""
+        for blob, path in zip(blobs, paths):
+            temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+            try:
+                os.link(blob, temp_path)
+            except OSError:
+                shutil.copyfile(blob, temp_path)
+            os.replace(temp_path, path)
+
+    def evict(self, keep=None):
+        """Drop entries past max_age, then least recently used ones until under max_bytes."""
+        with self._locked():
+            self._evict(keep)
+
+    def _evict(self, keep=None):
+        now = time.time()
+        by_use = sorted(self._index.items(), key=lambda item: item[1]["last_used"])
+        total = sum(entry["size"] for entry in self._index.values())
+        evicted = 0
+        for key, entry in by_use:
+            if key == keep:
+                continue
+            if now - entry["last_used"] <= self.max_age and total <= self.max_bytes:
+                break
+            shutil.rmtree(os.path.join(self._objects, key), ignore_errors=True)
+            del self._index[key]
+            total -= entry["size"]
+            evicted += 1
+        if evicted:
+            self.evictions += evicted
+            inc("marp_artifact_evictions_total", evicted)
+            log("Artifacts", f"Evicted {evicted} stored artifact(s), {total / 1048576:.1f} MiB left")
+            self._save()
+
+    def stats(self):
+        # index.json is replaced atomically, so reading it needs no lock.
+        self._read_index()
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "bytes": sum(entry["size"] for entry in self._index.values()),
+            "max_bytes": self.max_bytes,
+            "max_age_s": self.max_age,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
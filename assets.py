@@ -0,0 +1,290 @@
+import os
+import re
+import json
+import base64
+import struct
+import hashlib
+from typing import NamedTuple
+from urllib.parse import unquote, urlsplit
+from urllib.request import url2pathname
+from page_loader import load_html, virtual_url
+from metrics import inc, log, span
+
+# Markdown images (Marp size and bg keywords live in the alt text) and raw <img> tags.
+IMAGE_REF_RE = re.compile(
+    r'!\[[^\]]*\]\(\s*<?([^)\s>]+)>?(?:\s+"[^"]*")?\s*\)'
+    r'|<img\b[^>]*?\bsrc\s*=\s*["\']([^"\']+)["\']',
+    re.IGNORECASE
+)
+URL_SCHEME_RE = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*:(?!\\)')
+
+EXPORT_TYPES = {"jpeg": ("image/jpeg", ".jpg"), "webp": ("image/webp", ".webp")}
+
+# Copies smaller than this fraction of the original's pixels are worth making.
+DOWNSCALE_MIN_GAIN = 0.8
+
+DOWNSCALE_JS = """
+async ({url, width, height, type}) => {
+    const blob = await (await fetch(url)).blob();
+    const bitmap = await createImageBitmap(blob, {resizeWidth: width, resizeHeight: height, resizeQuality: 'high'});
+    const canvas = new OffscreenCanvas(width, height);
+    canvas.getContext('2d').drawImage(bitmap, 0, 0);
+    const out = new Uint8Array(await (await canvas.convertToBlob({type: type, quality: 0.9})).arrayBuffer());
+    let binary = '';
+    for (let i = 0; i < out.length; i += 0x8000) {
+        binary += String.fromCharCode.apply(null, out.subarray(i, i + 0x8000));
+    }
+    return btoa(binary);
+}
+"""
+
+
+class ImageInfo(NamedTuple):
+    width: int
+    height: int
+    kind: str
+    digest: str
+
+
+def _jpeg_orientation(segment):
+    """EXIF orientation tag of an APP1 segment, 1 (upright) when there is none."""
+    if not segment.startswith(b"Exif\0\0"):
+        return 1
+    tiff = segment[6:]
+    order = "<" if tiff[:2] == b"II" else ">"
+    ifd = struct.unpack(order + "I", tiff[4:8])[0]
+    count = struct.unpack(order + "H", tiff[ifd:ifd + 2])[0]
+    for n in range(count):
+        entry = tiff[ifd + 2 + 12 * n:ifd + 14 + 12 * n]
+        if struct.unpack(order + "H", entry[:2])[0] == 0x0112:
+            return struct.unpack(order + "H", entry[8:10])[0]
+    return 1
+
+
+def _jpeg_size(f):
+    orientation = 1
+    f.seek(2)
+    while True:
+        if f.read(1) != b"\xff":
+            return None
+        marker = f.read(1)
+        while marker == b"\xff":
+            marker = f.read(1)
+        if not marker or marker == b"\xda":
+            return None
+        if marker == b"\x01" or b"\xd0" <= marker <= b"\xd7":
+            continue
+        length = struct.unpack(">H", f.read(2))[0]
+        if marker == b"\xe1" and orientation == 1:
+            orientation = _jpeg_orientation(f.read(length - 2))
+        elif b"\xc0" <= marker <= b"\xcf" and marker not in (b"\xc4", b"\xc8", b"\xcc"):
+            height, width = struct.unpack(">xHH", f.read(5))
+            # Orientations 5-8 turn the image on its side, and browsers honour them.
+            return (height, width) if orientation >= 5 else (width, height)
+        else:
+            f.seek(length - 2, 1)
+
+
+def _webp_size(head):
+    chunk = head[12:16]
+    if chunk == b"VP8 " and head[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3fff, height & 0x3fff
+    if chunk == b"VP8L" and head[20] == 0x2f:
+        bits = struct.unpack("<I", head[21:25])[0]
+        return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+    if chunk == b"VP8X":
+        return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+    return None
+
+
+def image_size(path):
+    """
+    (kind, width, height) of a PNG, JPEG, GIF or WebP file, read from its header
+    without decoding the image; None for other or unreadable files. JPEG sizes
+    follow the EXIF orientation, as the image is displayed.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(32)
+            if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+                return ("png", *struct.unpack(">II", head[16:24]))
+            if head[:6] in (b"GIF87a", b"GIF89a"):
+                return ("gif", *struct.unpack("<HH", head[6:10]))
+            if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+                size = _webp_size(head)
+                return ("webp", *size) if size else None
+            if head[:2] == b"\xff\xd8":
+                size = _jpeg_size(f)
+                return ("jpeg", *size) if size else None
+    except (OSError, struct.error, IndexError):
+        pass
+    return None
+
+
+def image_refs(markdown):
+    """Image URLs referenced by `markdown`, outside fenced code blocks."""
+    refs = []
+    in_code = False
+    for line in markdown.split("\n"):
+        if line.strip().startswith("```"):
+            in_code = not in_code
+            continue
+        if in_code or ("](" not in line and "<img" not in line.lower()):
+            continue
+        refs.extend(markdown_ref or html_ref for markdown_ref, html_ref in IMAGE_REF_RE.findall(line))
+    return refs
+
+
+def probe_placeholders(images):
+    """
+    Route substitutes for the probe page: an empty SVG with each image's intrinsic
+    size, so layout reserves the same box without loading or decoding the image.
+    """
+    return {
+        path: {
+            "body": f'<svg xmlns="http://www.w3.org/2000/svg" width="{info.width}" height="{info.height}" '
+                    f'viewBox="0 0 {info.width} {info.height}"/>',
+            "content_type": "image/svg+xml",
+        }
+        for path, info in images.items()
+    }
+
+
+def layout_key(images):
+    """Key part for measured heights: the size of every referenced image."""
+    if not images:
+        return ""
+    sizes = sorted((path, info.width, info.height) for path, info in images.items())
+    return hashlib.sha256(json.dumps(sizes).encode("utf-8")).hexdigest()
+
+
+def content_key(images):
+    """Key part for exported artifacts: the content of every referenced image."""
+    if not images:
+        return ""
+    digests = sorted((path, info.digest) for path, info in images.items())
+    return hashlib.sha256(json.dumps(digests).encode("utf-8")).hexdigest()
+
+
+class ImageAssets:
+    """
+    The image stage of the pipeline.
+
+    scan() finds the local PNG, JPEG, GIF and WebP images a deck references and
+    reads their sizes from the file headers, so the probe can lay out placeholders
+    of the same size instead of the images themselves. export_copies() makes
+    downscaled copies that fit the exported slide resolution; they are decoded and
+    re-encoded in a pooled browser page and stored under `root` by content hash
+    and size, so each image is resized once however many decks use it.
+    """
+
+    def __init__(self, root, downscale=True):
+        self.root = root
+        self.downscale = downscale
+        # path -> (mtime_ns, size, ImageInfo), so unchanged images are not re-read and re-hashed.
+        self._infos = {}
+        # (digest, width, height) of copies that came out no smaller than the original.
+        self._kept = set()
+
+    @classmethod
+    def from_env(cls, base_dir):
+        """None when MARP_IMAGE_ASSETS=0, so images go to the browser and the exports as they are."""
+        if os.environ.get("MARP_IMAGE_ASSETS", "1") == "0":
+            return None
+        return cls(
+            os.environ.get("MARP_IMAGE_DIR") or os.path.join(base_dir, "output_slides", ".images"),
+            downscale=os.environ.get("MARP_IMAGE_DOWNSCALE", "1") != "0",
+        )
+
+    def _info(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        cached = self._infos.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        size = image_size(path)
+        if size is None:
+            return None
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        info = ImageInfo(size[1], size[2], size[0], digest)
+        self._infos[path] = (stat.st_mtime_ns, stat.st_size, info)
+        return info
+
+    def scan(self, markdown, base_dir):
+        """Map the absolute path of every local image in `markdown` (relative to base_dir) to its ImageInfo."""
+        images = {}
+        with span("assets.scan"):
+            for ref in image_refs(markdown):
+                if ref[:7].lower() == "file://":
+                    path = os.path.abspath(url2pathname(unquote(urlsplit(ref).path)))
+                elif URL_SCHEME_RE.match(ref) or ref.startswith("//"):
+                    continue
+                else:
+                    path = os.path.abspath(os.path.join(base_dir, unquote(ref.split("#", 1)[0].split("?", 1)[0])))
+                if path not in images:
+                    info = self._info(path)
+                    if info is not None:
+                        images[path] = info
+        return images
+
+    async def _downscale(self, page, path, info, size, copy_path):
+        mime, _ = EXPORT_TYPES.get(info.kind, ("image/png", ".png"))
+        encoded = await page.evaluate(
+            DOWNSCALE_JS, {"url": virtual_url(path), "width": size[0], "height": size[1], "type": mime}
+        )
+        data = base64.b64decode(encoded)
+        if len(data) >= os.path.getsize(path):
+            return False
+        temp_path = copy_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, copy_path)
+        return True
+
+    async def export_copies(self, images, browser_pool, box):
+        """
+        Route substitutes for the export page: each image larger than `box`
+        (width, height in device pixels) is served from a copy scaled to fit it.
+        Images already small enough, and copies that would not be smaller, are
+        served as they are.
+        """
+        if not self.downscale or not images:
+            return {}
+        substitutes = {}
+        todo = []
+        for path, info in images.items():
+            scale = min(box[0] / info.width, box[1] / info.height) if info.width and info.height else 1.0
+            if scale * scale > DOWNSCALE_MIN_GAIN:
+                continue
+            size = (max(1, round(info.width * scale)), max(1, round(info.height * scale)))
+            if (info.digest, *size) in self._kept:
+                continue
+            _, ext = EXPORT_TYPES.get(info.kind, ("image/png", ".png"))
+            copy_path = os.path.join(self.root, f"{info.digest[:32]}-{size[0]}x{size[1]}{ext}")
+            if os.path.exists(copy_path):
+                substitutes[path] = {"path": copy_path}
+            else:
+                todo.append((path, info, size, copy_path))
+
+        if todo:
+            os.makedirs(self.root, exist_ok=True)
+            with span("assets.downscale"):
+                async with browser_pool.lease() as page:
+                    await load_html(page, "<!DOCTYPE html><html><body></body></html>", self.root)
+                    for path, info, size, copy_path in todo:
+                        try:
+                            made = await self._downscale(page, path, info, size, copy_path)
+                        except Exception as e:
+                            log("Assets", f"Keeping {os.path.basename(path)} as it is: {e}")
+                            made = False
+                        if made:
+                            substitutes[path] = {"path": copy_path}
+                            inc("marp_images_downscaled_total")
+                        else:
+                            self._kept.add((info.digest, *size))
+            log("Assets", f"Serving {len(substitutes)}/{len(images)} image(s) downscaled for export")
+        return substitutes
@@ -0,0 +1,78 @@
+"""
+Micro-benchmark for the pure-Python parts of EngineSplitter: chunking and the
+Phase 3 page-boundary solver. No browser or Marp install is needed.
+
+    python benchmarks/bench_splitter.py --lines 5000 --repeat 5
+"""
+import os
+import sys
+import re
+import time
+import random
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import EngineSplitter
+from benchmarks.corpus import synthetic_deck
+
+
+def reference_boundaries(chunks, probe_ys, target_levels, safe_usable_height):
+    """The previous Phase 3 decision loop (heading regex per chunk), kept as the baseline."""
+    splits = []
+    baseline = 0
+    for idx, chunk in enumerate(chunks):
+        is_target_heading = False
+        if chunk.type == "text":
+            match = re.match(r'^ {0,3}(#{1,6})\s', chunk.text)
+            if match and len(match.group(1)) in target_levels:
+                is_target_heading = True
+        is_overflow = (probe_ys[idx] - baseline) > safe_usable_height
+        is_first_on_page = idx == 0 or baseline == probe_ys[idx - 1]
+        if (is_overflow or is_target_heading) and not is_first_on_page:
+            splits.append(idx)
+            baseline = probe_ys[idx - 1]
+    return splits
+
+
+def solve(splitter, chunks, probe_ys, target_levels, safe_usable_height):
+    heading_mask = np.fromiter((chunk.level in target_levels for chunk in chunks), dtype=bool, count=len(chunks))
+    return splitter._solve_boundaries(probe_ys, heading_mask, safe_usable_height)
+
+
+def best_of(repeat, fn, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    splitter = EngineSplitter()
+    text = synthetic_deck(args.lines)
+
+    chunk_time, chunks = best_of(args.repeat, splitter._safe_chunk_text, text)
+    rnd = random.Random(1)
+    probe_ys = np.cumsum([rnd.uniform(10, 60) for _ in chunks])
+    target_levels = {1, 2}
+
+    solve_time, splits = best_of(args.repeat, solve, splitter, chunks, probe_ys, target_levels, 590.0)
+    ref_time, ref_splits = best_of(args.repeat, reference_boundaries, chunks, probe_ys.tolist(), target_levels, 590.0)
+    assert splits == ref_splits, "vectorized solver disagrees with the reference walk"
+
+    print(f"lines={args.lines} chunks={len(chunks)} slides={len(splits) + 1}")
+    print(f"_safe_chunk_text            {chunk_time * 1000:9.2f} ms")
+    print(f"mask + _solve_boundaries    {solve_time * 1000:9.2f} ms")
+    print(f"previous Phase 3 loop       {ref_time * 1000:9.2f} ms  ({ref_time / solve_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Accuracy check of the layout estimator against Chromium measurements.
+
+Lays out synthetic decks twice with the same toolchain: once with every chunk
+measured in the browser and once with the estimator (MARP_LAYOUT_ESTIMATOR=1),
+then reports how far the estimated chunk heights are from the measured ones
+and whether the slide breaks differ. Run it against real Marp and Chrome/Edge
+before relying on the estimator for a theme:
+
+    python benchmarks/check_estimator.py --preset prose --preset lists --theme default
+
+Exits with status 1 when a height is off by more than --tolerance pixels or a
+slide break moves. --stub runs the same comparison on the in-process stand-ins.
+"""
+import os
+import sys
+import asyncio
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from engine import EngineSplitter
+from layout_estimator import CalibrationStore
+from benchmarks.corpus import PRESETS, synthetic_deck
+
+
+async def compare(text, theme, marp_bin, env, renderer, browser_pool, calibrations):
+    """(per-chunk height errors in px, slide starts measured, slide starts estimated) for one deck."""
+    splitter = EngineSplitter(slide_usable_height=620)
+    layouts = []
+    for store in (None, calibrations):
+        chunks, probe_ys, heading_mask, safe_usable_height = await splitter._layout(
+            text, theme, marp_bin, env, 2, browser_pool, renderer, None, store, None
+        )
+        starts = [0] + splitter._solve_boundaries(probe_ys, heading_mask, safe_usable_height) if chunks else []
+        layouts.append((np.diff(probe_ys, prepend=0.0), starts))
+    (measured, measured_starts), (estimated, estimated_starts) = layouts
+    return estimated - measured, measured_starts, estimated_starts
+
+
+async def run(args):
+    if args.stub:
+        from benchmarks.stubs import StubBrowserPool, StubRenderer
+        marp_bin, env = "marp", dict(os.environ)
+        renderer, browser_pool = StubRenderer(), StubBrowserPool()
+    else:
+        from browser_pool import BrowserPool
+        from marp_renderer import MarpRenderer
+        from server import prepare_toolchain
+        marp_bin, env, error = prepare_toolchain()
+        if error:
+            sys.exit(error)
+        renderer = MarpRenderer.discover(ROOT, env=env)
+        browser_pool = BrowserPool.from_env(executable_path=env["CHROME_PATH"])
+
+    calibrations = CalibrationStore()
+    ok = True
+    try:
+        for preset in args.preset or ["prose", "headings", "lists"]:
+            text = synthetic_deck(args.lines, preset, args.seed)
+            errors, measured_starts, estimated_starts = await compare(
+                text, args.theme, marp_bin, env, renderer, browser_pool, calibrations
+            )
+            off = np.abs(errors)
+            estimated = int(np.count_nonzero(off > 0.01))
+            moved = sorted(set(measured_starts) ^ set(estimated_starts))
+            print(
+                f"{preset}-{args.lines} ({args.theme}): {len(errors)} chunks, {estimated} estimated differently, "
+                f"max error {off.max(initial=0.0):.1f} px, p95 {np.percentile(off, 95) if len(off) else 0.0:.1f} px, "
+                f"{len(measured_starts)} slides measured / {len(estimated_starts)} estimated, "
+                f"{len(moved)} break(s) moved"
+            )
+            if off.max(initial=0.0) > args.tolerance or moved:
+                ok = False
+    finally:
+        if hasattr(renderer, "close"):
+            await renderer.close()
+        await browser_pool.close()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stub", action="store_true", help="use in-process stand-ins for Marp and Chromium")
+    parser.add_argument("--preset", action="append", choices=sorted(PRESETS),
+                        help="deck composition (repeatable, default: prose, headings and lists)")
+    parser.add_argument("--lines", type=int, default=500, help="deck size in lines")
+    parser.add_argument("--theme", default="default")
+    parser.add_argument("--tolerance", type=float, default=2.0, help="largest acceptable height error in px")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
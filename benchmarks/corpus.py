@@ -0,0 +1,93 @@
+"""
+Synthetic Markdown decks for the benchmarks.
+
+A deck is a sequence of sections, each opened by a heading and filled with
+blocks drawn from a weighted mix of content kinds. Generation is seeded, so a
+given (preset, lines, seed) always yields the same document.
+"""
+import random
+
+WORDS = (
+    "latency throughput layout probe render slide table matrix vector budget "
+    "cache theme margin heading browser export signal window measure border"
+).split()
+
+# Relative weight of each block kind per preset.
+PRESETS = {
+    "mixed": {"prose": 4, "list": 3, "table": 1, "code": 1, "math": 1},
+    "prose": {"prose": 1},
+    "lists": {"list": 1},
+    "tables": {"table": 1},
+    "code": {"code": 1},
+    "math": {"math": 2, "prose": 1},
+    "headings": {"prose": 1},
+}
+
+
+def _words(rnd, low, high):
+    return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(low, high)))
+
+
+def _prose(rnd):
+    paragraph = _words(rnd, 30, 120).capitalize() + "."
+    if rnd.random() < 0.3:
+        paragraph += " Inline math \\(a_i + b_i\\) and **bold** text."
+    return [paragraph]
+
+
+def _nested_list(rnd):
+    out = []
+    for i in range(rnd.randint(3, 8)):
+        out.append(f"- {_words(rnd, 3, 15)}")
+        for j in range(rnd.randint(0, 3)):
+            out.append(f"  {j + 1}. {_words(rnd, 2, 10)}")
+            for _ in range(rnd.randint(0, 2)):
+                out.append(f"    - {_words(rnd, 2, 8)}")
+    return out
+
+
+def _table(rnd):
+    columns = rnd.randint(3, 6)
+    out = [
+        "| " + " | ".join(f"Col {c}" for c in range(columns)) + " |",
+        "|" + "---|" * columns,
+    ]
+    for _ in range(rnd.randint(5, 40)):
+        out.append("| " + " | ".join(_words(rnd, 1, 4) for _ in range(columns)) + " |")
+    return out
+
+
+def _code(rnd):
+    out = ["```python"]
+    for i in range(rnd.randint(4, 30)):
+        out.append(f"{'    ' * rnd.randint(0, 2)}value_{i} = compute({_words(rnd, 1, 3).replace(' ', ', ')})")
+    out.append("```")
+    return out
+
+
+def _math(rnd):
+    if rnd.random() < 0.5:
+        return ["$$", "\\sum_{i=1}^{n} x_i^2 = \\int_0^1 f(t)\\,dt", "$$"]
+    return ["\\[", "E = mc^2 + \\frac{a}{b}", "\\]"]
+
+
+BLOCKS = {"prose": _prose, "list": _nested_list, "table": _table, "code": _code, "math": _math}
+
+
+def synthetic_deck(lines: int = 2000, preset: str = "mixed", seed: int = 0):
+    """Return a Markdown document of roughly `lines` lines following `preset`."""
+    rnd = random.Random(seed)
+    weights = PRESETS[preset]
+    kinds = list(weights)
+    # The "headings" preset opens a new section after almost every block.
+    blocks_per_section = (1, 2) if preset == "headings" else (2, 6)
+    out = []
+    section = 0
+    while len(out) < lines:
+        section += 1
+        level = 1 if section % 5 == 1 else rnd.choice((2, 2, 3))
+        out += [f"{'#' * level} Section {section}: {_words(rnd, 1, 4)}", ""]
+        for _ in range(rnd.randint(*blocks_per_section)):
+            kind = rnd.choices(kinds, weights=[weights[k] for k in kinds])[0]
+            out += BLOCKS[kind](rnd) + [""]
+    return "\n".join(out[:lines])
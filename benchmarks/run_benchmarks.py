@@ -0,0 +1,191 @@
+"""
+Per-phase benchmark of the deck pipeline on synthetic decks.
+
+Times, for every (preset, size) deck: the Markdown normalization done by
+create_presentation, _safe_chunk_text, the probe render (Marp), the Chromium
+measurement, Phase 3 splitting, and every export format on its own and all
+together. Results are written as JSON so runs can be compared:
+
+    python benchmarks/run_benchmarks.py --stub --output before.json
+    python benchmarks/run_benchmarks.py --stub --output after.json --compare before.json
+
+--stub swaps the Marp worker and Chromium for in-process stand-ins, which
+isolates the pure-Python cost; without it the real toolchain is used (the
+same discovery as the server, so Marp and Chrome/Edge must be installed).
+The height cache is disabled so every run measures; the layout estimator is
+on (pass --no-estimator to send every chunk to the browser).
+"""
+import os
+import sys
+import json
+import shutil
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from engine import EngineSplitter
+from layout_estimator import CalibrationStore
+from exporter import export_presentation
+from normalizer import normalize_lines
+from server import prepare_toolchain
+from benchmarks.corpus import PRESETS, synthetic_deck
+
+EXPORT_FORMATS = ("pdf", "pptx", "png")
+
+
+def summarize(samples):
+    ms = [s * 1000 for s in samples]
+    return {
+        "min_ms": round(min(ms), 3),
+        "median_ms": round(statistics.median(ms), 3),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "runs": len(ms),
+    }
+
+
+async def bench_deck(text, repeat, marp_bin, env, renderer, browser_pool, scratch_dir, calibrations):
+    samples = {}
+
+    def record(phase, seconds):
+        samples.setdefault(phase, []).append(seconds)
+
+    splitter = EngineSplitter(slide_usable_height=620)
+    info = {}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        normalized = "\n".join(normalize_lines(text)[0])
+        record("normalize", time.perf_counter() - started)
+
+        started = time.perf_counter()
+        chunks = splitter._safe_chunk_text(normalized)
+        record("chunk_text", time.perf_counter() - started)
+
+        started = time.perf_counter()
+        split = await splitter.process(normalized, "default", marp_bin, env, 2,
+                                       browser_pool=browser_pool, renderer=renderer,
+                                       calibrations=calibrations)
+        record("process", time.perf_counter() - started)
+        for phase in ("probe_render", "measure", "phase3"):
+            record(phase, splitter.last_timings.get(phase, 0.0))
+
+        deck_markdown = "---\nmarp: true\ntheme: default\npaginate: true\n---\n\n" + split
+        md_file = os.path.join(scratch_dir, "bench.md")
+        with open(md_file, "w", encoding="utf-8") as f:
+            f.write(deck_markdown)
+        for formats in [(fmt,) for fmt in EXPORT_FORMATS] + [EXPORT_FORMATS]:
+            targets = {fmt: os.path.join(scratch_dir, f"bench.{fmt}") for fmt in formats}
+            started = time.perf_counter()
+            results = await export_presentation(md_file, deck_markdown, targets, marp_bin, env,
+                                                renderer=renderer, browser_pool=browser_pool)
+            name = f"export_{formats[0]}" if len(formats) == 1 else "export_all"
+            record(name, time.perf_counter() - started)
+            failed = {fmt: detail for fmt, (ok, detail) in results.items() if not ok}
+            if failed:
+                info.setdefault("export_errors", {}).update(failed)
+
+        info.update(chunks=len(chunks), slides=split.count("\n---\n") + 1)
+    return {"phases": {phase: summarize(values) for phase, values in samples.items()}, **info}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results, baseline):
+    base = {deck["name"]: deck for deck in baseline.get("decks", [])}
+    print(f"\n{'deck':<22}{'phase':<14}{'before ms':>12}{'after ms':>12}{'change':>9}")
+    for deck in results["decks"]:
+        old = base.get(deck["name"])
+        if not old:
+            continue
+        for phase, stats in deck["phases"].items():
+            before = old["phases"].get(phase, {}).get("median_ms")
+            if not before:
+                continue
+            after = stats["median_ms"]
+            print(f"{deck['name']:<22}{phase:<14}{before:>12.2f}{after:>12.2f}{(after - before) / before:>+9.0%}")
+
+
+async def run(args):
+    if args.stub:
+        from benchmarks.stubs import StubBrowserPool, StubRenderer
+        marp_bin, env = "marp", dict(os.environ)
+        renderer, browser_pool = StubRenderer(), StubBrowserPool()
+    else:
+        from browser_pool import BrowserPool
+        from marp_renderer import MarpRenderer
+        marp_bin, env, error = prepare_toolchain()
+        if error:
+            sys.exit(error)
+        renderer = MarpRenderer.discover(ROOT, env=env)
+        browser_pool = BrowserPool.from_env(executable_path=env["CHROME_PATH"])
+
+    # Shared across decks, so only the first one pays for the calibration, as in the server.
+    calibrations = None if args.no_estimator else CalibrationStore()
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": git_revision(),
+            "mode": "stub" if args.stub else "real",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "estimator": not args.no_estimator,
+        },
+        "decks": [],
+    }
+    scratch_dir = tempfile.mkdtemp(prefix="marp-bench-")
+    try:
+        for preset in args.preset or ["mixed"]:
+            for lines in args.lines:
+                name = f"{preset}-{lines}"
+                text = synthetic_deck(lines, preset, args.seed)
+                deck = await bench_deck(text, args.repeat, marp_bin, env, renderer, browser_pool, scratch_dir,
+                                        calibrations)
+                results["decks"].append({"name": name, "preset": preset, "lines": lines, **deck})
+                phases = ", ".join(f"{p} {s['median_ms']:.1f}" for p, s in deck["phases"].items())
+                print(f"{name}: {deck['chunks']} chunks, {deck['slides']} slides | {phases} (median ms)")
+    finally:
+        if renderer is not None and hasattr(renderer, "close"):
+            await renderer.close()
+        await browser_pool.close()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stub", action="store_true", help="use in-process stand-ins for Marp and Chromium")
+    parser.add_argument("--preset", action="append", choices=sorted(PRESETS),
+                        help="deck composition (repeatable, default: mixed)")
+    parser.add_argument("--lines", type=int, nargs="+", default=[500, 2000], help="deck sizes in lines")
+    parser.add_argument("--no-estimator", action="store_true", help="measure every chunk in the browser")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark-results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier results file to compare medians against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Stand-ins for the Marp worker and the browser pool, so the benchmark can run
+the whole pipeline without Node or Chromium. The stub renderer passes the
+Markdown through as "HTML"; the stub page answers the measurement script with
+heights estimated from the text between probes, one probe window per slide.
+"""
+import re
+import asyncio
+from contextlib import asynccontextmanager
+
+from engine import FUSED_MEASURE_JS, MEASURE_JS
+from layout_estimator import CALIBRATE_JS
+
+PROBE_RE = re.compile(r'data-idx="(\d+)"')
+DECK_RE = re.compile(r'<div data-marp-deck="(\d+)">')
+LINE_HEIGHT = 28
+CHARS_PER_LINE = 80
+
+
+def _fake_heights(markdown):
+    probes = []
+    for window in re.split(r"\n---\n", markdown):
+        y = 0.0
+        parts = PROBE_RE.split(window)
+        # parts = [text, idx, text, idx, ...]; a probe closes the chunk before it
+        for i in range(1, len(parts), 2):
+            text = re.sub(r"<[^>]+>", "", parts[i - 1].replace("<br>", "\n")).strip()
+            rows = max(1, sum(-(-len(line) // CHARS_PER_LINE) for line in text.split("\n") if line.strip()))
+            y += rows * LINE_HEIGHT + 8
+            probes.append({"idx": int(parts[i]), "y": y})
+    return probes
+
+
+class StubRenderer:
+    async def render(self, markdown, html=False, inline_svg=False, script=False):
+        slides = markdown.count("\n---\n") + 1
+        body = "".join('<svg data-marpit-svg="" viewBox="0 0 1280 720"></svg>' for _ in range(slides))
+        return {"html": f'<div class="marpit">{markdown if not inline_svg else body}</div>', "css": "",
+                "comments": [[] for _ in range(slides)]}
+
+    async def render_document(self, markdown, html=False, base_href=None, script=False):
+        return (await self.render(markdown, html=html))["html"]
+
+    async def write_pptx(self, image_paths, notes, width_px, height_px, output_path):
+        with open(output_path, "wb") as f:
+            f.write(b"PK")
+        return {"path": output_path, "slides": len(image_paths)}
+
+
+class _StubRoute:
+    def __init__(self, page, url):
+        self.page = page
+        self.request = type("Request", (), {"url": url})()
+
+    async def fulfill(self, body="", **kwargs):
+        self.page.content = body
+
+
+class _StubLocator:
+    async def screenshot(self, path):
+        with open(path, "wb") as f:
+            f.write(b"\x89PNG")
+
+    def nth(self, index):
+        return self
+
+
+class StubPage:
+    def __init__(self):
+        self.content = ""
+        self._handler = None
+
+    async def route(self, pattern, handler):
+        self._handler = handler
+
+    async def goto(self, url):
+        await self._handler(_StubRoute(self, url))
+
+    async def evaluate(self, script, *args):
+        await asyncio.sleep(0)
+        if script is MEASURE_JS:
+            return {"usableHeight": 600.0, "probes": _fake_heights(self.content)}
+        if script is FUSED_MEASURE_JS:
+            parts = DECK_RE.split(self.content)
+            return {parts[i]: {"usableHeight": 600.0, "probes": _fake_heights(parts[i + 1])}
+                    for i in range(1, len(parts), 2)}
+        if script is CALIBRATE_JS:
+            return {idx: {"width": CHARS_PER_LINE * 8.0, "ascii": [8.0] * 95, "wide": 16.0, "transform": "none"}
+                    for idx in PROBE_RE.findall(self.content)}
+        return {"waitedOn": ["stub"], "signals": {}, "elapsedMs": 0, "timedOut": False}
+
+    async def pdf(self, path, **kwargs):
+        with open(path, "wb") as f:
+            f.write(b"%PDF")
+
+    def locator(self, selector):
+        return _StubLocator()
+
+
+class StubBrowserPool:
+    @asynccontextmanager
+    async def lease(self, **context_options):
+        yield StubPage()
+
+    async def close(self):
+        pass
@@ -0,0 +1,235 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+from metrics import inc, log, span
+
+CONTEXT_CLOSE_TIMEOUT = 10
+
+
+def _rss_mb(pid):
+    """Resident set size of a process in MB, from /proc; 0 where that is not available."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return 0.0
+
+
+class _PooledBrowser:
+    def __init__(self, browser):
+        self.browser = browser
+        self.uses = 0
+        self.active = 0
+        self.memory_mb = 0.0
+        self.cdp = None
+
+
+class BrowserPool:
+    """
+    Server-scoped pool of warm headless Chromium instances.
+
+    Each lease hands out a page inside a fresh, isolated browser context, so
+    probes never share cookies, storage or layout state. Up to `size` browsers
+    are launched lazily, each serving at most `pages_per_browser` leases at a
+    time. Browsers are health-checked before every lease and recycled after
+    `max_uses` leases or once the resident memory of all its processes (browser,
+    renderers, GPU; sampled after each lease) exceeds `max_memory_mb`;
+    a browser that is being recycled finishes its open leases before closing.
+    """
+
+    def __init__(self, size=1, executable_path=None, max_uses=200, max_memory_mb=1024, pages_per_browser=4):
+        self.size = max(1, int(size))
+        self.executable_path = executable_path
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self.pages_per_browser = max(1, int(pages_per_browser))
+        self._playwright = None
+        self._slots = [None] * self.size
+        self._live = set()
+        self._capacity = None
+        self._lock = asyncio.Lock()
+        self._closed = False
+        self.launched = 0
+        self.recycled = 0
+        self.leases = 0
+
+    @classmethod
+    def from_env(cls, executable_path=None):
+        """Build a pool sized by the MARP_BROWSER_* environment variables."""
+        return cls(
+            size=int(os.environ.get("MARP_BROWSER_POOL_SIZE", "1")),
+            executable_path=executable_path,
+            max_uses=int(os.environ.get("MARP_BROWSER_MAX_USES", "200")),
+            max_memory_mb=float(os.environ.get("MARP_BROWSER_MAX_MEMORY_MB", "1024")),
+            pages_per_browser=int(os.environ.get("MARP_BROWSER_PAGES", "4")),
+        )
+
+    async def start(self):
+        async with self._lock:
+            if self._closed:
+                raise RuntimeError("Browser pool is closed")
+            if self._playwright is not None:
+                return
+            self._playwright = await async_playwright().start()
+            self._capacity = asyncio.Semaphore(self.size * self.pages_per_browser)
+
+    async def warm(self, count=None):
+        """
+        Launch up to `count` browsers (every slot by default) and load one page,
+        so the first lease does not pay for Playwright and Chromium start-up.
+        Returns the browser version.
+        """
+        await self.start()
+        async with self._lock:
+            for index in range(min(self.size, count or self.size)):
+                if self._slots[index] is None:
+                    self._slots[index] = await self._launch()
+        async with self.lease() as page:
+            await page.set_content("<p>warmup</p>")
+        return next(slot.browser.version for slot in self._slots if slot is not None)
+
+    async def _launch(self):
+        with span("browser.launch"):
+            browser = await self._playwright.chromium.launch(headless=True, executable_path=self.executable_path)
+        slot = _PooledBrowser(browser)
+        self._live.add(slot)
+        self.launched += 1
+        return slot
+
+    async def _retire(self, slot):
+        self._live.discard(slot)
+        try:
+            await slot.browser.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, slot):
+        return slot is not None and slot.browser.is_connected()
+
+    def _needs_recycle(self, slot):
+        if self.max_uses and slot.uses >= self.max_uses:
+            return True
+        if self.max_memory_mb and slot.memory_mb >= self.max_memory_mb:
+            return True
+        return False
+
+    async def _detach(self, index, reason):
+        """Take a browser out of rotation; it closes once its last lease ends."""
+        slot = self._slots[index]
+        self._slots[index] = None
+        self.recycled += 1
+        inc("marp_browser_recycles_total", reason=reason)
+        if slot.active == 0:
+            await self._retire(slot)
+
+    async def _sample_memory(self, slot):
+        # The browser lists its processes over CDP; their RSS comes from /proc (Linux only).
+        try:
+            if slot.cdp is None:
+                slot.cdp = await slot.browser.new_browser_cdp_session()
+            info = await asyncio.wait_for(slot.cdp.send("SystemInfo.getProcessInfo"), timeout=CONTEXT_CLOSE_TIMEOUT)
+        except Exception:
+            return
+        slot.memory_mb = sum(_rss_mb(process["id"]) for process in info.get("processInfo", ()))
+
+    async def _acquire_slot(self):
+        async with self._lock:
+            for index, slot in enumerate(self._slots):
+                if slot is None:
+                    continue
+                if not self._is_healthy(slot):
+                    log("BrowserPool", "Replacing disconnected browser")
+                    await self._detach(index, "disconnected")
+                elif self._needs_recycle(slot):
+                    await self._detach(index, "worn")
+
+            best = None
+            for slot in self._slots:
+                if slot is not None and slot.active < self.pages_per_browser:
+                    if best is None or slot.active < best.active:
+                        best = slot
+            # Spread load over more processes before doubling up on a busy one.
+            if best is None or best.active > 0:
+                for index, slot in enumerate(self._slots):
+                    if slot is None:
+                        best = self._slots[index] = await self._launch()
+                        break
+            best.active += 1
+            return best
+
+    @asynccontextmanager
+    async def lease(self, **context_options):
+        """Lease a page in an isolated context; it is closed when the block exits."""
+        await self.start()
+        await self._capacity.acquire()
+        slot = None
+        context = None
+        try:
+            slot = await self._acquire_slot()
+            context = await slot.browser.new_context(**context_options)
+            page = await context.new_page()
+            self.leases += 1
+            yield page
+        finally:
+            # A second cancellation can land in any await below; the slot count and
+            # the capacity permit must still be given back or the pool shrinks for good.
+            try:
+                if context is not None:
+                    try:
+                        # Bounded, so a cancelled lease cannot hang on a wedged browser.
+                        await asyncio.wait_for(context.close(), timeout=CONTEXT_CLOSE_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        log("BrowserPool", "Browser context did not close in time; retiring its browser")
+                        async with self._lock:
+                            if slot in self._slots:
+                                await self._detach(self._slots.index(slot), "stuck")
+                    except Exception:
+                        pass
+                if slot is not None and self.max_memory_mb and slot in self._slots:
+                    await self._sample_memory(slot)
+            finally:
+                try:
+                    if slot is not None:
+                        slot.active -= 1
+                        slot.uses += 1
+                        if (self._closed or slot not in self._slots) and slot.active == 0:
+                            await self._retire(slot)
+                finally:
+                    self._capacity.release()
+
+    async def health_check(self):
+        """Drop browsers that lost their connection; returns the number replaced."""
+        replaced = 0
+        async with self._lock:
+            for index, slot in enumerate(self._slots):
+                if slot is not None and not self._is_healthy(slot):
+                    await self._detach(index, "disconnected")
+                    replaced += 1
+        return replaced
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "live": len(self._live),
+            "active": sum(slot.active for slot in self._live),
+            "launched": self.launched,
+            "recycled": self.recycled,
+            "leases": self.leases,
+        }
+
+    async def close(self):
+        """Close every browser and stop the Playwright driver."""
+        self._closed = True
+        for slot in list(self._live):
+            await self._retire(slot)
+        self._slots = [None] * self.size
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
@@ -0,0 +1,123 @@
+import os
+import time
+import signal
+import asyncio
+import subprocess
+import contextvars
+from contextlib import contextmanager
+from metrics import log
+
+REQUEST_TIMEOUT = float(os.environ.get("MARP_REQUEST_TIMEOUT_S", "600"))
+
+_deadline = contextvars.ContextVar("marp_deadline", default=None)
+
+
+class PhaseError(Exception):
+    """A pipeline phase that failed or ran out of time; `phase` names it (split.measure, export.pdf, ...)."""
+
+    def __init__(self, phase, message, timed_out=False):
+        super().__init__(f"[{phase}] {message}")
+        self.phase = phase
+        self.message = message
+        self.timed_out = timed_out
+
+    def to_dict(self):
+        return {"phase": self.phase, "message": self.message, "timedOut": self.timed_out}
+
+
+@contextmanager
+def request_deadline(seconds=REQUEST_TIMEOUT):
+    """
+    Bound everything awaited inside the block, tasks it spawns included, by one
+    deadline. A nested scope can only shorten the deadline it inherits.
+    """
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(cap=None):
+    """Seconds left before the request deadline, capped by a phase's own limit; None if unbounded."""
+    deadline = _deadline.get()
+    left = None if deadline is None else deadline - time.monotonic()
+    if cap is not None:
+        left = cap if left is None else min(left, cap)
+    return left
+
+
+async def within(phase, awaitable, cap=None):
+    """
+    Await `awaitable` until the deadline (or `cap` seconds). Running out of time
+    and any other failure (a crashed page, a failed navigation, ...) are raised
+    as PhaseError naming `phase`; the original exception is its __cause__.
+    """
+    timeout = remaining(cap)
+    if timeout is not None and timeout <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise PhaseError(phase, "request deadline passed before the phase started", timed_out=True)
+    try:
+        return await asyncio.wait_for(awaitable, timeout=timeout)
+    except asyncio.TimeoutError:
+        raise PhaseError(phase, f"timed out after {timeout:.3g} s", timed_out=True) from None
+    except PhaseError:
+        raise
+    except Exception as e:
+        raise PhaseError(phase, str(e) or type(e).__name__) from e
+
+
+async def kill_tree(proc):
+    """
+    Kill a process started by run_process() together with everything it spawned.
+    On POSIX the process group is swept even after its leader exited, which
+    catches a Chromium that marp left behind.
+    """
+    try:
+        if os.name != "nt":
+            os.killpg(proc.pid, signal.SIGKILL)
+        elif proc.returncode is None:
+            killer = await asyncio.create_subprocess_exec(
+                "taskkill", "/F", "/T", "/PID", str(proc.pid),
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+            )
+            await killer.wait()
+    except OSError:
+        pass
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+    # Shielded so a second cancellation cannot leave a zombie behind.
+    await asyncio.shield(proc.wait())
+
+
+async def run_process(phase, cmd, env=None, cwd=None, cap=None):
+    """
+    Run `cmd` in its own process group under the request deadline and return its
+    stdout. On timeout, failure or cancellation the whole process tree (marp and
+    the Chromium it starts) is killed; errors are raised as PhaseError.
+    """
+    group = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == "nt" else {"start_new_session": True}
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, stdin=asyncio.subprocess.DEVNULL,
+            env=env, cwd=cwd, **group
+        )
+    except OSError as e:
+        raise PhaseError(phase, f"could not start {os.path.basename(cmd[0])}: {e}") from e
+    try:
+        stdout, stderr = await within(phase, proc.communicate(), cap)
+    except BaseException:
+        log("Deadline", f"Killing {os.path.basename(cmd[0])} (pid {proc.pid}) after {phase} was interrupted")
+        await kill_tree(proc)
+        raise
+    if proc.returncode != 0:
+        await kill_tree(proc)
+        detail = stderr.decode("utf-8", errors="replace").strip()
+        raise PhaseError(phase, detail[-2000:] or f"exited with code {proc.returncode}")
+    return stdout
@@ -1,28 +1,139 @@
 import os
-import sys
 import asyncio
 import re
-from playwright.async_api import async_playwright
+import bisect
+import shutil
+import tempfile
+import numpy as np
+from browser_pool import BrowserPool
+from readiness import wait_for_render_ready
+from page_loader import load_html
+from marp_renderer import MarpRenderer, MarpRendererError
+from deadline import PhaseError, run_process, within
+from assets import layout_key, probe_placeholders
+from measure_cache import HeightCache, block_key, theme_fingerprint
+from metrics import inc, log, span
+from layout_estimator import (
+    CALIBRATE_JS, CalibrationStore, LayoutEstimator, calibration_deck, chunk_kind, fit_calibration
+)
+
+# Probe pages hold about this many chunks; bigger measurements are split into
+# segments that are measured on separate pages at the same time.
+PROBE_SEGMENT_CHUNKS = max(1, int(os.environ.get("MARP_PROBE_SEGMENT_CHUNKS", "400")))
+
+# Measures the probes under `root`: the document, or the shadow root of one deck in a fused probe.
+MEASURE_ROOT_JS = """
+(root) => {
+    const sections = Array.from(root.querySelectorAll('section'));
+    const style = window.getComputedStyle(sections[0]);
+    const usableHeight = 720 - (parseFloat(style.paddingTop) || 0) - (parseFloat(style.paddingBottom) || 0);
+
+    // Each probe window is its own slide, so offsets are taken from the top of
+    // the content box of the section that contains the probe.
+    const contentTops = new Map(sections.map(section => {
+        const pt = parseFloat(window.getComputedStyle(section).paddingTop) || 0;
+        return [section, section.getBoundingClientRect().top + pt];
+    }));
+
+    const probes = Array.from(root.querySelectorAll('.m-probe'));
+
+    return {
+        usableHeight: usableHeight,
+        probes: probes.map(p => {
+            let target = p.parentElement;
+            const blockTags = ['li', 'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'tr', 'div', 'blockquote', 'pre'];
+            while (target && !blockTags.includes(target.tagName.toLowerCase()) && target.tagName.toLowerCase() !== 'section') {
+                target = target.parentElement;
+            }
+            if (!target || target.tagName.toLowerCase() === 'section') {
+                target = p.parentElement || p;
+            }
+            
+            const rect = target.getBoundingClientRect();
+            const tStyle = window.getComputedStyle(target);
+            const mb = parseFloat(tStyle.marginBottom) || 0;
+            const contentTop = contentTops.get(p.closest('section')) ?? contentTops.get(sections[0]);
+            
+            return { idx: parseInt(p.dataset.idx), y: rect.bottom + mb - contentTop };
+        })
+    };
+}
+"""
+
+MEASURE_JS = f"() => ({MEASURE_ROOT_JS.strip()})(document)"
+
+# One result per deck of a fused probe, keyed by the host's data-marp-deck.
+FUSED_MEASURE_JS = f"""
+() => {{
+    const measure = {MEASURE_ROOT_JS.strip()};
+    return Object.fromEntries(Array.from(
+        document.querySelectorAll('[data-marp-deck]'),
+        host => [host.dataset.marpDeck, measure(host.shadowRoot)]
+    ));
+}}
+"""
+
+HEADING_RE = re.compile(r'^(#{1,6})\s')
+HEADING_TEXT_RE = re.compile(r'^ {0,3}(#{1,6})\s')
+LIST_ITEM_RE = re.compile(r'^([ \t]*)([\-\*\+]|\d+\.)\s')
+TABLE_SEP_RE = re.compile(r'^\|[\s\-\|:]+\|$')
+
+
+class Chunk:
+    """
+    One splittable unit: a text block (paragraph, list item, heading, code or math
+    block), a table header or a single table row. `context` holds the parent list
+    item lines to repeat when the chunk opens a new slide, `header` the table
+    header for rows, and `level` the heading level of text chunks (0 otherwise).
+    """
+    __slots__ = ("type", "text", "context", "header", "blank_before", "level")
+
+    def __init__(self, type, text, context=(), header=None, blank_before=False):
+        self.type = type
+        self.text = text
+        self.context = context
+        self.header = header
+        self.blank_before = blank_before
+        match = HEADING_TEXT_RE.match(text) if type == "text" and text[:4].lstrip(' ')[:1] == '#' else None
+        self.level = len(match.group(1)) if match else 0
+
 
 class EngineSplitter:
-    def __init__(self, slide_usable_height=620):
+    def __init__(self, slide_usable_height=620, segment_chunks=PROBE_SEGMENT_CHUNKS, probe_batcher=None):
         self.usable_height = slide_usable_height
+        self.segment_chunks = segment_chunks
+        # A probe_batch.ProbeBatcher shared with other decks, or None for a page per probe.
+        self.probe_batcher = probe_batcher
+        self.last_readiness = None
+        # Probe pages serve these in place of the deck's images (see assets.probe_placeholders).
+        self.image_placeholders = None
+        # Seconds spent in each phase of the last process() call.
+        self.last_timings = {}
         
-    def _get_target_heading_levels(self, text: str, split_levels: int):
-            levels = set()
-            for line in text.split('\n'):
-                match = re.match(r'^(#{1,6})\s', line)
-                if match:
-                    levels.add(len(match.group(1)))
+    def _get_target_heading_levels(self, chunks, split_levels: int):
+            # Heading lines outside code and math always open a chunk, so chunk levels cover them
+            # all; a bare "#" line followed by text is not a heading line on its own.
+            levels = {
+                chunk.level for chunk in chunks
+                if chunk.level and chunk.text[:1] == '#' and chunk.text[chunk.level] != '\n'
+            }
             if not levels:
                 return {1, 2}
             return set(sorted(list(levels))[:split_levels])
 
-    def _safe_chunk_text(self, text: str):
-        lines = text.split('\n')
+    def _safe_chunk_text(self, text):
+        """
+        Split the document (a string or an iterable of lines, such as the
+        normalizer's output) into Chunks in one pass over its lines.
+
+        Each line is classified once (fence/math toggles, table row, list item,
+        heading, blank) with precompiled patterns; code and math blocks stay
+        whole, tables are split into a header chunk plus one chunk per row, and
+        every chunk carries the enclosing list items it needs when it starts a slide.
+        """
         chunks = []
         current_chunk = []
-        current_context = []
+        current_context = ()
         list_hierarchy = {}
         in_code = False
         in_math = False
@@ -31,122 +142,89 @@ class EngineSplitter:
         
         pending_blank = False
 
-        def close_chunk(force_type="text", header=None):
-            nonlocal current_chunk, current_context, pending_blank
+        def list_context():
+            return tuple(list_hierarchy[k] for k in sorted(list_hierarchy)) if list_hierarchy else ()
+
+        def close_chunk():
+            nonlocal current_chunk, pending_blank
             if current_chunk:
-                chunks.append({
-                    "type": force_type, 
-                    "text": "\n".join(current_chunk), 
-                    "context": list(current_context), 
-                    "header": header,
-                    "blank_before": pending_blank
-                })
+                chunks.append(Chunk("text", "\n".join(current_chunk), current_context, None, pending_blank))
                 current_chunk = []
                 pending_blank = False
 
-        for line in lines:
+        for line in text.split('\n') if isinstance(text, str) else text:
             stripped = line.strip()
             if stripped.startswith('```'):
                 in_code = not in_code
-            if line.count('$$') % 2 != 0:
+            if '$$' in line and line.count('$$') % 2 != 0:
                 in_math = not in_math
 
             if in_code or in_math:
                 if not current_chunk:
-                    current_context = [list_hierarchy[k] for k in sorted(list_hierarchy.keys())]
+                    current_context = list_context()
                 current_chunk.append(line)
                 continue
 
-            is_table_row = bool(re.match(r'^\|.*\|$', stripped))
+            is_table_row = len(stripped) >= 2 and stripped[0] == '|' and stripped[-1] == '|'
 
             if not in_table:
                 if is_table_row:
                     current_chunk.append(line)
                     if len(current_chunk) >= 2:
                         prev = current_chunk[-2].strip()
-                        curr = current_chunk[-1].strip()
-                        if re.match(r'^\|.*\|$', prev) and re.match(r'^\|[\s\-\|:]+\|$', curr):
+                        if len(prev) >= 2 and prev[0] == '|' and prev[-1] == '|' and TABLE_SEP_RE.match(stripped):
                             in_table = True
                             table_header = current_chunk[-2] + "\n" + current_chunk[-1]
                             pre_table = current_chunk[:-2]
                             current_chunk = []
                             if pre_table:
-                                chunks.append({
-                                    "type": "text", 
-                                    "text": "\n".join(pre_table), 
-                                    "context": list(current_context), 
-                                    "header": None,
-                                    "blank_before": pending_blank
-                                })
+                                chunks.append(Chunk("text", "\n".join(pre_table), current_context, None, pending_blank))
                                 pending_blank = False
-                            chunks.append({
-                                "type": "table_header", 
-                                "text": table_header, 
-                                "context": [], 
-                                "header": table_header,
-                                "blank_before": pending_blank
-                            })
+                            chunks.append(Chunk("table_header", table_header, (), table_header, pending_blank))
                             pending_blank = False
                             list_hierarchy = {}
+                elif not stripped:
+                    close_chunk()
+                    pending_blank = True
+                elif line[0] == '#' and HEADING_RE.match(line):
+                    close_chunk()
+                    list_hierarchy = {}
+                    current_context = ()
+                    current_chunk = [line]
                 else:
-                    is_list_item = bool(re.match(r'^([ \t]*)([\-\*\+]|\d+\.)\s', line))
-                    is_heading = bool(re.match(r'^(#{1,6})\s', line))
-                    is_blank = (stripped == '')
-
-                    if is_blank:
+                    match = LIST_ITEM_RE.match(line)
+                    if match:
                         close_chunk()
-                        pending_blank = True
-                    elif is_heading:
-                        close_chunk()
-                        list_hierarchy = {}
-                        current_context = []
-                        current_chunk = [line]
-                    elif is_list_item:
-                        close_chunk()
-                        match = re.match(r'^([ \t]*)([\-\*\+]|\d+\.)\s', line)
                         indent = len(match.group(1).replace('\t', '    '))
-
-                        keys_to_remove = [k for k in list_hierarchy.keys() if k >= indent]
-                        for k in keys_to_remove:
+                        for k in [k for k in list_hierarchy if k >= indent]:
                             del list_hierarchy[k]
 
-                        current_context = [list_hierarchy[k] for k in sorted(list_hierarchy.keys())]
+                        current_context = list_context()
                         list_hierarchy[indent] = line
                         current_chunk = [line]
                     else:
-                        match = re.match(r'^([ \t]+)', line)
-                        if not match and not current_chunk:
-                            list_hierarchy = {}
                         if not current_chunk:
-                            current_context = [list_hierarchy[k] for k in sorted(list_hierarchy.keys())]
+                            if line[0] not in ' \t':
+                                list_hierarchy = {}
+                            current_context = list_context()
                         current_chunk.append(line)
             else:
                 if is_table_row:
-                    chunks.append({
-                        "type": "table_row", 
-                        "text": line, 
-                        "header": table_header, 
-                        "context": [],
-                        "blank_before": False
-                    })
+                    chunks.append(Chunk("table_row", line, (), table_header, False))
                 else:
                     in_table = False
                     table_header = ""
                     list_hierarchy = {}
                     if stripped != '':
-                        is_list_item = bool(re.match(r'^([ \t]*)([\-\*\+]|\d+\.)\s', line))
-                        is_heading = bool(re.match(r'^(#{1,6})\s', line))
-                        if is_list_item:
-                            match = re.match(r'^([ \t]*)([\-\*\+]|\d+\.)\s', line)
+                        current_context = ()
+                        match = LIST_ITEM_RE.match(line)
+                        if match:
                             indent = len(match.group(1).replace('\t', '    '))
-                            current_context = []
                             list_hierarchy[indent] = line
                             current_chunk = [line]
-                        elif is_heading:
-                            current_context = []
+                        elif line[0] == '#' and HEADING_RE.match(line):
                             current_chunk = [line]
                         else:
-                            current_context = []
                             current_chunk.append(line)
                     else:
                         pending_blank = True
@@ -154,12 +232,124 @@ class EngineSplitter:
         close_chunk()
         return chunks
 
-    async def process(self, text: str, theme: str, marp_bin: str, env: dict, heading_split_levels: int = 2):
-        sys.stderr.write("DEBUG: [Two-Pass] Phase 1 - Build probe DOM...\n")
-        
-        target_levels = self._get_target_heading_levels(text, heading_split_levels)
-        chunks = self._safe_chunk_text(text)
+    def _solve_boundaries(self, probe_ys, heading_mask, safe_usable_height):
+        """
+        Return the chunk indices that start a new slide.
+
+        Equivalent to walking the chunks one by one: a chunk breaks the page when it
+        overflows the current page or is a target heading, unless it is already the
+        first chunk on its page. For non-decreasing offsets, one vectorized
+        searchsorted finds, for every possible page start, the first chunk that
+        would overflow it, and a second one finds the next target heading; the walk
+        then just hops from candidate to candidate, once per slide.
+        """
+        n = len(probe_ys)
+        if n < 2:
+            return []
+        ys = probe_ys.tolist()
+        if not np.all(probe_ys[1:] >= probe_ys[:-1]):
+            return self._walk_boundaries(ys, heading_mask.tolist(), safe_usable_height)
+
+        baselines = np.concatenate(([0.0], probe_ys[:-1]))
+        next_overflow = np.searchsorted(probe_ys, baselines + safe_usable_height, side='right')
+        headings = np.flatnonzero(heading_mask).tolist()
+        headings.append(n)
+
+        splits = []
+        page_start = 0
+        baseline = 0.0
+        while True:
+            # Re-check the overflow candidate with the exact per-chunk test
+            # (y - baseline > height) so rounding in baseline + height cannot move it.
+            overflow = max(int(next_overflow[page_start]), page_start + 1)
+            while overflow > page_start + 1 and ys[overflow - 1] - baseline > safe_usable_height:
+                overflow -= 1
+            while overflow < n and not (ys[overflow] - baseline > safe_usable_height):
+                overflow += 1
+
+            candidate = min(overflow, headings[bisect.bisect_left(headings, page_start + 1)])
+            if candidate >= n:
+                break
+            if ys[candidate - 1] != baseline:
+                splits.append(candidate)
+            # Either a new page starts here, or every chunk since the page start was
+            # empty; both leave the candidate as the first chunk on its page.
+            page_start = candidate
+            baseline = ys[candidate - 1]
+        return splits
+
+    def _walk_boundaries(self, ys, heading_mask, safe_usable_height):
+        splits = []
+        baseline = 0.0
+        for idx in range(1, len(ys)):
+            if ((ys[idx] - baseline) > safe_usable_height or heading_mask[idx]) and baseline != ys[idx - 1]:
+                splits.append(idx)
+                baseline = ys[idx - 1]
+        return splits
+
+    async def _render_probe_cli(self, probe_md, marp_bin, env, base_dir):
+        """Render the probe with the marp CLI inside a private scratch directory; returns the HTML."""
+        scratch_dir = tempfile.mkdtemp(prefix="marp-probe-")
+        try:
+            probe_md_file = os.path.join(scratch_dir, "probe.md")
+            probe_html_file = os.path.join(scratch_dir, "probe.html")
+            with open(probe_md_file, "w", encoding="utf-8") as f:
+                f.write(probe_md)
+
+            cmd = [marp_bin, probe_md_file, "-o", probe_html_file, "--html", "--allow-local-files"]
+            themes_dir = os.path.join(base_dir, "themes")
+            if os.path.exists(themes_dir):
+                cmd.extend(["--theme-set", themes_dir])
+
+            with span("subprocess.marp_cli", stage="probe"):
+                await run_process("split.probe_render", cmd, env=env)
+            if not os.path.exists(probe_html_file):
+                raise PhaseError("split.probe_render", "marp CLI produced no probe HTML")
+            with open(probe_html_file, "r", encoding="utf-8") as f:
+                return f.read()
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    def _layout_blocks(self, chunks):
+        """
+        Group chunks into layout blocks: runs whose rendered heights do not depend on
+        anything after them. A block starts at a heading, a table header, or an
+        unindented non-list paragraph after a blank line; lists (whose tight/loose
+        rendering depends on every item) and tables always stay inside one block.
+        """
+        starts = []
+        for idx, chunk in enumerate(chunks):
+            if idx == 0 or chunk.type == "table_header":
+                starts.append(idx)
+            elif chunk.type == "text" and not chunk.context:
+                first_line = chunk.text.split('\n', 1)[0]
+                if HEADING_RE.match(first_line):
+                    starts.append(idx)
+                elif chunk.blank_before and not first_line[:1].isspace() and not LIST_ITEM_RE.match(first_line):
+                    starts.append(idx)
+        return [(start, end) for start, end in zip(starts, starts[1:] + [len(chunks)])]
+
+    def _probe_line(self, idx, chunk):
+        c_type = chunk.type
+        c_text = chunk.text
+        probe = f'<span class="m-probe" data-idx="{idx}" style="font-size:0; line-height:0; margin:0; padding:0; visibility:hidden;"></span>'
         
+        if c_type == "table_row":
+            last_pipe = c_text.rfind('|')
+            return c_text[:last_pipe] + probe + c_text[last_pipe:] if last_pipe != -1 else c_text + probe
+        elif c_type == "table_header":
+            lines = c_text.split('\n')
+            last_pipe = lines[0].rfind('|')
+            if last_pipe != -1:
+                lines[0] = lines[0][:last_pipe] + probe + lines[0][last_pipe:]
+            return "\n".join(lines)
+        elif c_text.strip().endswith('```') or c_text.strip().endswith('$$'):
+            return c_text + f"\n{probe}\n"
+        else:
+            return c_text + probe
+
+    def _build_probe_markdown(self, chunks, windows, theme):
+        """Render each (start, end) chunk window on its own auto-height probe slide."""
         probe_md_lines = [
             "---",
             "marp: true",
@@ -168,138 +358,337 @@ class EngineSplitter:
             "<style>section { height: auto !important; overflow: visible !important; }</style>\n"
         ]
         
-        for idx, chunk in enumerate(chunks):
-            if chunk.get("blank_before") and idx > 0:
-                probe_md_lines.append("") 
-                
-            c_type = chunk["type"]
-            c_text = chunk["text"]
-            probe = f'<span class="m-probe" data-idx="{idx}" style="font-size:0; line-height:0; margin:0; padding:0; visibility:hidden;"></span>'
-            
-            if c_type == "table_row":
-                last_pipe = c_text.rfind('|')
-                row = c_text[:last_pipe] + probe + c_text[last_pipe:] if last_pipe != -1 else c_text + probe
-                probe_md_lines.append(row)
-            elif c_type == "table_header":
-                lines = c_text.split('\n')
-                last_pipe = lines[0].rfind('|')
-                if last_pipe != -1:
-                    lines[0] = lines[0][:last_pipe] + probe + lines[0][last_pipe:]
-                probe_md_lines.append("\n".join(lines))
-            else:
-                if c_text.strip().endswith('```') or c_text.strip().endswith('$$'):
-                    probe_md_lines.append(c_text + f"\n{probe}\n")
-                else:
-                    probe_md_lines.append(c_text + probe)
+        for w_idx, (start, end) in enumerate(windows):
+            if w_idx > 0:
+                probe_md_lines.extend(["", "---", ""])
+            for idx in range(start, end):
+                chunk = chunks[idx]
+                if chunk.blank_before and idx > start:
+                    probe_md_lines.append("") 
+                probe_md_lines.append(self._probe_line(idx, chunk))
                 
-        probe_md = "\n".join(probe_md_lines)
-        
+        return "\n".join(probe_md_lines)
+
+    async def _measure(self, probe_md, marp_bin, env, browser_pool, renderer, calibrate=False):
         base_dir = os.path.abspath(os.getcwd())
+        # Relative asset paths resolve against the output folder, where the deck's .md lives.
         output_dir = os.path.join(base_dir, "output_slides")
-        os.makedirs(output_dir, exist_ok=True)
-        probe_md_file = os.path.join(output_dir, "probe_temp.md")
-        probe_html_file = os.path.join(output_dir, "probe_temp.html")
-        
-        with open(probe_md_file, "w", encoding="utf-8") as f:
-            f.write(probe_md)
-            
-        cmd = [marp_bin, probe_md_file, "-o", probe_html_file, "--html", "--allow-local-files"]
-        themes_dir = os.path.join(base_dir, "themes")
-        if os.path.exists(themes_dir):
-            cmd.extend(["--theme-set", themes_dir])
-
-        proc = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, stdin=asyncio.subprocess.DEVNULL, env=env
+
+        # Probes of concurrent decks can share a page; calibration decks always get their own.
+        fused = self.probe_batcher is not None and renderer is not None and not calibrate
+        with span("split.probe_render") as phase:
+            probe_html = rendered = None
+            if renderer is not None:
+                # With marp-core's browser script, as the export and the CLI probe have it, so
+                # fit headings and wide code or math are measured at their scaled-down size.
+                try:
+                    if fused:
+                        rendered = await within(
+                            "split.probe_render", renderer.render(probe_md, html=True, script=True)
+                        )
+                    else:
+                        probe_html = await within(
+                            "split.probe_render", renderer.render_document(probe_md, html=True, script=True)
+                        )
+                except PhaseError as e:
+                    if not isinstance(e.__cause__, MarpRendererError):
+                        raise
+                    inc("marp_fallbacks_total", stage="probe")
+                    log("Two-Pass", f"Marp worker failed, falling back to CLI: {e.__cause__}")
+            if probe_html is None and rendered is None:
+                probe_html = await self._render_probe_cli(probe_md, marp_bin, env, base_dir)
+        # Pages of one measurement run concurrently, so keep the longest rather than the sum.
+        self.last_timings["probe_render"] = max(self.last_timings.get("probe_render", 0.0), phase.elapsed)
+
+        with span("split.measure") as phase:
+            if rendered is not None:
+                result, self.last_readiness = await within(
+                    "split.measure", self.probe_batcher.measure(rendered, self.image_placeholders)
+                )
+            else:
+                pool = browser_pool or BrowserPool(size=1, executable_path=env.get("CHROME_PATH"))
+                try:
+                    result = await within(
+                        "split.measure", self._evaluate_probe(pool, probe_html, output_dir, calibrate)
+                    )
+                finally:
+                    if browser_pool is None:
+                        await pool.close()
+        self.last_timings["measure"] = max(self.last_timings.get("measure", 0.0), phase.elapsed)
+
+        log(
+            "Two-Pass",
+            f"Render ready after {self.last_readiness['elapsedMs']:.0f} ms "
+            f"(waited on {self.last_readiness['waitedOn']})"
         )
-        await proc.communicate()
-        
-        sys.stderr.write("DEBUG: [Two-Pass] Phase 2 - Chromium physical measurement...\n")
+        return result
 
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True, executable_path=env.get("CHROME_PATH"))
-            page = await browser.new_page()
-            await page.goto(f"file://{probe_html_file}")
-            await page.wait_for_timeout(1000) 
-            
-            js_code = """
-            () => {
-                const section = document.querySelector('section');
-                const style = window.getComputedStyle(section);
-                const pt = parseFloat(style.paddingTop) || 0;
-                const pb = parseFloat(style.paddingBottom) || 0;
-                const usableHeight = 720 - pt - pb;
-
-                const probes = Array.from(document.querySelectorAll('.m-probe'));
-                const contentTop = section.getBoundingClientRect().top + pt;
-
-                return {
-                    usableHeight: usableHeight,
-                    probes: probes.map(p => {
-                        let target = p.parentElement;
-                        const blockTags = ['li', 'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'tr', 'div', 'blockquote', 'pre'];
-                        while (target && !blockTags.includes(target.tagName.toLowerCase()) && target.tagName.toLowerCase() !== 'section') {
-                            target = target.parentElement;
-                        }
-                        if (!target || target.tagName.toLowerCase() === 'section') {
-                            target = p.parentElement || p;
-                        }
-                        
-                        const rect = target.getBoundingClientRect();
-                        const tStyle = window.getComputedStyle(target);
-                        const mb = parseFloat(tStyle.marginBottom) || 0;
-                        
-                        return { idx: parseInt(p.dataset.idx), y: rect.bottom + mb - contentTop };
-                    })
-                };
-            }
-            """
-            result = await page.evaluate(js_code)
-            await browser.close()
+    async def _evaluate_probe(self, pool, probe_html, output_dir, calibrate):
+        # One awaitable for the whole lease, so a deadline also covers waiting for a page.
+        async with pool.lease() as page:
+            await load_html(page, probe_html, output_dir, self.image_placeholders)
+            self.last_readiness = await wait_for_render_ready(page)
+            result = await page.evaluate(MEASURE_JS)
+            if calibrate:
+                result["calibration"] = await page.evaluate(CALIBRATE_JS)
+        return result
 
-        usable_height = result["usableHeight"]
-        probe_data = result["probes"]
-        safe_usable_height = usable_height - 30
+    def _segment_runs(self, runs, blocks, chunks, target_levels):
+        """
+        Cut runs of blocks to measure into segments of about segment_chunks chunks.
+        Cuts go before a target heading, where Phase 3 splits anyway, or at any block
+        start once a segment reaches twice the size; each segment becomes its own
+        probe window led by the block before it, so its heights do not change.
+        """
+        limit = self.segment_chunks
+        segments = []
+        for run in runs:
+            current = []
+            size = 0
+            for b_idx in run:
+                start, end = blocks[b_idx]
+                forced = chunks[start].level in target_levels
+                if current and ((forced and size >= limit) or size >= 2 * limit):
+                    segments.append(current)
+                    current = []
+                    size = 0
+                current.append(b_idx)
+                size += end - start
+            segments.append(current)
+        return segments
 
-        sys.stderr.write("DEBUG: [Two-Pass] Phase 3 - Physical boundary measurement...\n")
-        final_lines = []
-        current_page_baseline = 0
-        
-        for data in probe_data:
-            idx = data["idx"]
-            y_pos = data["y"]
-            chunk = chunks[idx]
-            
-            is_target_heading = False
-            if chunk["type"] == "text":
-                match = re.match(r'^ {0,3}(#{1,6})\s', chunk["text"])
-                if match and len(match.group(1)) in target_levels:
-                    is_target_heading = True
-            
-            is_overflow = (y_pos - current_page_baseline) > safe_usable_height
-            is_first_on_page = (idx == 0) or (current_page_baseline == probe_data[idx-1]["y"])
-            
-            if (is_overflow or is_target_heading) and not is_first_on_page:
-                if idx > 0:
-                    final_lines.append("\n---\n")
-                    current_page_baseline = probe_data[idx-1]["y"] 
-                    
-                    if chunk.get("type") == "table_row":
-                        final_lines.append(chunk["header"])
-                        
-                    if chunk.get("context"):
-                        for ctx_line in chunk["context"]:
-                            final_lines.append(ctx_line)
+    async def _measure_windows(self, chunks, windows, theme, marp_bin, env, browser_pool, renderer, calibrate=False):
+        """
+        Measure probe windows on pages of about segment_chunks chunks each, all pages
+        at the same time (bounded by the browser pool), and merge their results.
+        The merged result also holds, under "windows", each window's {idx: y}.
+        """
+        pages = []
+        size = 0
+        for start, end in windows:
+            # A segment's lead block is the previous segment's tail; such windows need separate pages.
+            if pages and size + (end - start) <= self.segment_chunks and start >= pages[-1][-1][1]:
+                pages[-1].append((start, end))
+                size += end - start
             else:
-                if chunk.get("blank_before") and len(final_lines) > 0 and final_lines[-1] != "\n---\n":
-                    final_lines.append("")
-                        
-            final_lines.append(chunk["text"])
+                pages.append([(start, end)])
+                size = end - start
+        if len(pages) > 1:
+            log("Two-Pass", f"Measuring {len(windows)} probe window(s) on {len(pages)} pages in parallel")
 
+        # Without a server pool, the pages share one short-lived browser.
+        owned = browser_pool is None and len(pages) > 1
+        pool = BrowserPool(size=1, executable_path=env.get("CHROME_PATH")) if owned else browser_pool
         try:
-            os.remove(probe_md_file)
-            os.remove(probe_html_file)
-        except:
-            pass
+            results = await asyncio.gather(*(
+                self._measure(self._build_probe_markdown(chunks, page, theme), marp_bin, env, pool, renderer,
+                              calibrate=calibrate)
+                for page in pages
+            ))
+        finally:
+            if owned:
+                await pool.close()
+
+        merged = {"usableHeight": results[0]["usableHeight"], "probes": [], "windows": []}
+        for page, result in zip(pages, results):
+            merged["probes"].extend(result["probes"])
+            # Windows on one page cover disjoint chunk ranges, so probe indices stay unique.
+            ys = {data["idx"]: data["y"] for data in result["probes"]}
+            merged["windows"].extend(ys for _ in page)
+            if calibrate:
+                merged.setdefault("calibration", {}).update(result["calibration"])
+        return merged
+
+    async def _calibrate(self, theme, marp_bin, env, browser_pool, renderer):
+        """Measure the calibration deck for `theme` and fit the layout estimator's model."""
+        chunks, windows, layout = calibration_deck(self._safe_chunk_text)
+        with span("split.calibrate"):
+            result = await self._measure_windows(chunks, windows, theme, marp_bin, env, browser_pool, renderer,
+                                                 calibrate=True)
+        log("Two-Pass", f"Calibrated layout estimator for theme '{theme}'")
+        return fit_calibration(layout, result, result["usableHeight"])
+
+    async def _layout(self, text, theme, marp_bin, env, heading_split_levels, browser_pool, renderer,
+                      height_cache, calibrations, images):
+        """
+        Phases 1 and 2: chunk the document and find every chunk's bottom edge, from
+        the height cache, the layout estimator or the browser. `images` (from
+        ImageAssets.scan) are laid out as same-size placeholders. Returns (chunks,
+        probe_ys, heading_mask, safe_usable_height) for Phase 3.
+        """
+        self.last_timings = {"probe_render": 0.0, "measure": 0.0}
+        self.image_placeholders = probe_placeholders(images) if images else None
 
-        return "\n".join(final_lines)
\ No newline at end of file
+        with span("split.chunk") as phase:
+            chunks = self._safe_chunk_text(text)
+            target_levels = self._get_target_heading_levels(chunks, heading_split_levels)
+            blocks = self._layout_blocks(chunks)
+        self.last_timings["chunk"] = phase.elapsed
+        inc("marp_chunks_total", len(chunks))
+
+        theme_key = theme_fingerprint(theme, os.path.join(os.path.abspath(os.getcwd()), "themes"))
+        # Image sizes change heights without changing the text, so they are part of block keys.
+        blocks_key = f"{theme_key}|{layout_key(images)}" if images else theme_key
+        block_keys = []
+        deltas = [0.0] * len(chunks)
+        missing = []
+
+        # Blocks of plain headings, paragraphs and flat lists are laid out analytically
+        # from the theme calibration; everything else goes to the browser.
+        estimator = None
+        kinds = [chunk_kind(chunks, idx) for idx in range(len(chunks))] if calibrations is not None else []
+        estimable = [
+            all(kinds[idx][1] for idx in range(start, end)) and (start == 0 or kinds[start - 1][0] is not None)
+            for start, end in blocks
+        ] if calibrations is not None else [False] * len(blocks)
+        if any(estimable):
+            calibration = calibrations.get(theme_key)
+            if calibration is None:
+                calibration = await self._calibrate(theme, marp_bin, env, browser_pool, renderer)
+                calibrations.put(theme_key, calibration)
+            estimator = LayoutEstimator(calibration)
+
+        for b_idx, (start, end) in enumerate(blocks):
+            if estimator is not None and estimable[b_idx]:
+                for idx in range(start, end):
+                    prev_kind = kinds[idx - 1][0] if idx > 0 else "start"
+                    deltas[idx] = estimator.delta(kinds[idx][0], prev_kind, chunks[idx].text)
+                block_keys.append(None)
+                continue
+            lead = chunks[blocks[b_idx - 1][0]:blocks[b_idx - 1][1]] if b_idx > 0 else []
+            key = block_key(blocks_key, lead, chunks[start:end])
+            block_keys.append(key)
+            cached = height_cache.get(key) if height_cache is not None else None
+            if cached is not None and len(cached) == end - start:
+                deltas[start:end] = cached
+            else:
+                missing.append(b_idx)
+
+        usable_height = height_cache.get_usable_height(theme_key) if height_cache is not None else None
+        if usable_height is None and estimator is not None:
+            usable_height = estimator.calibration["usableHeight"]
+        if estimator is not None:
+            inc("marp_estimated_blocks_total", sum(estimable))
+            log("Two-Pass", f"Estimated {sum(estimable)}/{len(blocks)} layout blocks without the browser")
+        if chunks and (missing or usable_height is None):
+            if not missing:
+                missing = [0]
+            # Consecutive stale blocks share a probe window, led by the block before them
+            # so the first measured chunk sees the same margins as in the full document.
+            runs = []
+            for b_idx in missing:
+                if runs and runs[-1][-1] == b_idx - 1:
+                    runs[-1].append(b_idx)
+                else:
+                    runs.append([b_idx])
+            runs = self._segment_runs(runs, blocks, chunks, target_levels)
+            windows = []
+            for run in runs:
+                lead_start = blocks[run[0] - 1][0] if run[0] > 0 else blocks[run[0]][0]
+                windows.append((lead_start, blocks[run[-1]][1]))
+            log(
+                "Two-Pass",
+                f"Measuring {len(missing)}/{len(blocks)} layout blocks in {len(windows)} probe window(s)"
+            )
+            inc("marp_probes_total", sum(end - start for start, end in windows))
+
+            result = await self._measure_windows(chunks, windows, theme, marp_bin, env, browser_pool, renderer)
+            usable_height = result["usableHeight"]
+            measured = []
+
+            for w_idx, run in enumerate(runs):
+                ys = result["windows"][w_idx]
+                measured_start = blocks[run[0]][0]
+                prev_y = 0.0
+                for idx in range(windows[w_idx][0], windows[w_idx][1]):
+                    y_pos = ys.get(idx, prev_y)
+                    if idx >= measured_start:
+                        deltas[idx] = y_pos - prev_y
+                    prev_y = y_pos
+                for b_idx in run:
+                    start, end = blocks[b_idx]
+                    measured.append((block_keys[b_idx], deltas[start:end]))
+            if height_cache is not None:
+                # One transaction for the whole measurement instead of a commit per block.
+                height_cache.put_many(measured)
+                height_cache.put_usable_height(theme_key, usable_height)
+        elif chunks and estimator is None:
+            log("Two-Pass", f"All {len(blocks)} layout blocks served from cache")
+        cache_lookups = len(blocks) - sum(estimable)
+        if cache_lookups:
+            inc("marp_height_cache_hits_total", cache_lookups - len(missing))
+            inc("marp_height_cache_misses_total", len(missing))
+
+        probe_ys = np.cumsum(np.asarray(deltas, dtype=float))
+        safe_usable_height = (usable_height or 0) - 30
+        heading_mask = np.fromiter((chunk.level in target_levels for chunk in chunks), dtype=bool, count=len(chunks))
+        return chunks, probe_ys, heading_mask, safe_usable_height
+
+    async def process(self, text, theme: str, marp_bin: str, env: dict, heading_split_levels: int = 2,
+                      browser_pool: BrowserPool = None, renderer: MarpRenderer = None,
+                      height_cache: HeightCache = None, calibrations: CalibrationStore = None, images=None):
+        chunks, probe_ys, heading_mask, safe_usable_height = await self._layout(
+            text, theme, marp_bin, env, heading_split_levels, browser_pool, renderer, height_cache, calibrations,
+            images
+        )
+
+        with span("split.phase3") as phase:
+            splits = set(self._solve_boundaries(probe_ys, heading_mask, safe_usable_height))
+
+            final_lines = []
+            for idx, chunk in enumerate(chunks):
+                if idx in splits:
+                    final_lines.append("\n---\n")
+                    if chunk.type == "table_row":
+                        final_lines.append(chunk.header)
+                    final_lines.extend(chunk.context)
+                elif chunk.blank_before and final_lines and final_lines[-1] != "\n---\n":
+                    final_lines.append("")
+                final_lines.append(chunk.text)
+        self.last_timings["phase3"] = phase.elapsed
+        inc("marp_slides_total", len(splits) + 1 if chunks else 0)
+
+        return "\n".join(final_lines)
+
+    async def plan(self, text, theme: str, marp_bin: str, env: dict, heading_split_levels: int = 2,
+                   browser_pool: BrowserPool = None, renderer: MarpRenderer = None,
+                   height_cache: HeightCache = None, calibrations: CalibrationStore = None, images=None):
+        """
+        Paginate like process() without building the deck. Returns one dict per
+        slide: its chunk range [start, end), the measured content height against
+        safe_usable_height and the resulting fill ratio, why the slide starts where
+        it does ("start", "heading" or "overflow"), and the table header and list
+        items it repeats from the previous slide.
+        """
+        chunks, probe_ys, heading_mask, safe_usable_height = await self._layout(
+            text, theme, marp_bin, env, heading_split_levels, browser_pool, renderer, height_cache, calibrations,
+            images
+        )
+
+        with span("split.phase3") as phase:
+            starts = [0] + self._solve_boundaries(probe_ys, heading_mask, safe_usable_height) if chunks else []
+            ys = probe_ys.tolist()
+            slides = []
+            for start, end in zip(starts, starts[1:] + [len(chunks)]):
+                chunk = chunks[start]
+                height = ys[end - 1] - (ys[start - 1] if start else 0.0)
+                if start == 0:
+                    reason = "start"
+                elif heading_mask[start]:
+                    reason = "heading"
+                else:
+                    reason = "overflow"
+                slides.append({
+                    "start": start,
+                    "end": end,
+                    "height": round(height, 1),
+                    "safe_usable_height": safe_usable_height,
+                    "fill_ratio": round(height / safe_usable_height, 3) if safe_usable_height > 0 else 0.0,
+                    "split_reason": reason,
+                    "heading_level": chunk.level,
+                    "carried_header": chunk.header if start and chunk.type == "table_row" else None,
+                    "carried_context": list(chunk.context) if start else [],
+                    "first_line": chunk.text.split("\n", 1)[0].strip()[:80],
+                })
+        self.last_timings["phase3"] = phase.elapsed
+        return slides
\ No newline at end of file
@@ -0,0 +1,179 @@
+import os
+import re
+import shutil
+import asyncio
+import tempfile
+from marp_renderer import MarpRendererError, build_html_document
+from readiness import wait_for_render_ready
+from page_loader import load_html
+from metrics import inc, log, span
+from deadline import PhaseError, run_process, within
+
+EXPORT_TIMEOUT = float(os.environ.get("MARP_EXPORT_TIMEOUT_S", "120"))
+
+# PPTX slides are full-bleed images, captured at 2x like the Marp CLI does.
+PPTX_IMAGE_SCALE = 2
+
+EXPORT_CSS = """
+div.marpit > svg[data-marpit-svg] { display: block; }
+@page { size: %(width)dpx %(height)dpx; margin: 0; }
+@media print {
+    html, body { -webkit-print-color-adjust: exact; print-color-adjust: exact; }
+    div.marpit > svg[data-marpit-svg] + svg[data-marpit-svg] { break-before: page; }
+}
+"""
+
+
+def png_paths(output_base: str, count: int):
+    """Slide image paths, named like the CLI's `--images png` output: deck.001.png, ..."""
+    return [f"{output_base}.{i + 1:03d}.png" for i in range(count)]
+
+
+async def _guarded(fmt, coro, timeout):
+    """
+    Run one format's export so its timeout or failure cannot affect the others.
+    It is bounded by `timeout` and by the request deadline, whichever comes first;
+    errors come back as "[export.<fmt>] message".
+    """
+    phase = f"export.{fmt}"
+    try:
+        with span(phase):
+            return True, await within(phase, coro, cap=timeout)
+    except PhaseError as e:
+        return False, str(e)
+
+
+async def _run_marp_cli(marp_bin, md_file, output_path, env, extra_args=(), phase="export"):
+    cmd = [marp_bin, md_file, "-o", output_path, "--allow-local-files", *extra_args]
+
+    themes_dir = os.path.join(os.path.abspath(os.getcwd()), "themes")
+    if os.path.exists(themes_dir):
+        cmd.extend(["--theme-set", themes_dir])
+
+    # The caller's _guarded() bounds the run; a cancelled run kills marp and its Chromium.
+    with span("subprocess.marp_cli", stage="export"):
+        await run_process(phase, cmd, env=env)
+    return output_path
+
+
+async def _run_marp_cli_images(marp_bin, md_file, output_path, env):
+    base = os.path.splitext(output_path)[0]
+    await _run_marp_cli(marp_bin, md_file, base + ".png", env, ["--images", "png"], phase="export.png")
+    directory = os.path.dirname(base)
+    prefix = os.path.basename(base) + "."
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith(prefix) and re.match(r"^\d{3}\.png$", name[len(prefix):])
+    )
+
+
+async def _export_with_cli(md_file, targets, marp_bin, env, timeout):
+    """Fallback when the Marp worker is unavailable: one CLI process per format, run side by side."""
+    jobs = {}
+    for fmt, output_path in targets.items():
+        if fmt == "png":
+            job = _run_marp_cli_images(marp_bin, md_file, output_path, env)
+        else:
+            job = _run_marp_cli(marp_bin, md_file, output_path, env, phase=f"export.{fmt}")
+        jobs[fmt] = _guarded(fmt, job, timeout)
+    results = await asyncio.gather(*jobs.values())
+    return dict(zip(jobs.keys(), results))
+
+
+async def _open_deck(page, deck):
+    html_doc, base_dir, substitutes = deck
+    await load_html(page, html_doc, base_dir, substitutes)
+    await wait_for_render_ready(page)
+
+
+async def _export_pdf(browser_pool, deck, size, output_path):
+    width, height = size
+    async with browser_pool.lease(viewport={"width": width, "height": height}) as page:
+        await _open_deck(page, deck)
+        await page.pdf(
+            path=output_path, width=f"{width}px", height=f"{height}px",
+            print_background=True, prefer_css_page_size=True
+        )
+    return output_path
+
+
+async def _capture_slides(browser_pool, deck, size, paths, scale):
+    width, height = size
+    async with browser_pool.lease(viewport={"width": width, "height": height}, device_scale_factor=scale) as page:
+        await _open_deck(page, deck)
+        slides = page.locator("div.marpit > svg[data-marpit-svg]")
+        for i, path in enumerate(paths):
+            await slides.nth(i).screenshot(path=path)
+    return paths
+
+
+async def _export_pptx(browser_pool, renderer, deck, size, notes, output_path):
+    image_dir = tempfile.mkdtemp(prefix="marp-pptx-")
+    try:
+        images = png_paths(os.path.join(image_dir, "slide"), len(notes))
+        await _capture_slides(browser_pool, deck, size, images, PPTX_IMAGE_SCALE)
+        await renderer.write_pptx(images, notes, size[0], size[1], output_path)
+    finally:
+        shutil.rmtree(image_dir, ignore_errors=True)
+    return output_path
+
+
+async def export_presentation(md_file, markdown, targets, marp_bin, env, renderer=None, browser_pool=None,
+                              timeout=EXPORT_TIMEOUT, images=None, image_assets=None):
+    """
+    Produce every requested format from a single HTML render of `markdown`.
+
+    `targets` maps a format ("pptx", "pdf", "png") to its output path; for PNG the
+    path's extension is replaced by `.001.png`, `.002.png`, ... The formats are
+    exported concurrently, each with its own timeout, and the result maps every
+    format to `(ok, detail)` where detail is the output path(s) or an error message.
+    Without the Marp worker this falls back to parallel marp CLI runs.
+
+    With `image_assets`, the deck's `images` (from ImageAssets.scan) are served
+    as copies downscaled to the largest size a slide can show them at; the CLI
+    fallback embeds the original files.
+    """
+    rendered = None
+    if renderer is not None and browser_pool is not None:
+        try:
+            rendered = await within("export.render", renderer.render(markdown, inline_svg=True, script=True))
+        except PhaseError as e:
+            if not isinstance(e.__cause__, MarpRendererError):
+                raise
+            inc("marp_fallbacks_total", stage="export")
+            log("Export", f"Marp worker failed, falling back to CLI: {e.__cause__}")
+    if rendered is None:
+        return await _export_with_cli(md_file, targets, marp_bin, env, timeout)
+
+    view_box = re.search(r'viewBox="0 0 (\d+(?:\.\d+)?) (\d+(?:\.\d+)?)"', rendered["html"])
+    size = (round(float(view_box.group(1))), round(float(view_box.group(2)))) if view_box else (1280, 720)
+    notes = ["\n\n".join(slide_comments) for slide_comments in rendered["comments"]]
+
+    # Served from memory as if it sat next to the .md file, so relative assets still resolve.
+    output_dir = os.path.dirname(os.path.abspath(md_file))
+    substitutes = None
+    if image_assets is not None and images:
+        # PPTX captures at PPTX_IMAGE_SCALE, so that is the most detail any format keeps.
+        box = (size[0] * PPTX_IMAGE_SCALE, size[1] * PPTX_IMAGE_SCALE)
+        try:
+            substitutes = await within("export.images", image_assets.export_copies(images, browser_pool, box))
+        except PhaseError as e:
+            if e.timed_out:
+                raise
+            log("Export", f"Image downscaling failed, exporting the original images: {e.message}")
+    deck = (
+        build_html_document(rendered, extra_css=EXPORT_CSS % {"width": size[0], "height": size[1]}),
+        output_dir, substitutes
+    )
+
+    jobs = {}
+    for fmt, output_path in targets.items():
+        if fmt == "pdf":
+            jobs[fmt] = _guarded(fmt, _export_pdf(browser_pool, deck, size, output_path), timeout)
+        elif fmt == "pptx":
+            jobs[fmt] = _guarded(fmt, _export_pptx(browser_pool, renderer, deck, size, notes, output_path), timeout)
+        elif fmt == "png":
+            paths = png_paths(os.path.splitext(output_path)[0], len(notes))
+            jobs[fmt] = _guarded(fmt, _capture_slides(browser_pool, deck, size, paths, 1), timeout)
+    results = await asyncio.gather(*jobs.values())
+    return dict(zip(jobs.keys(), results))
@@ -0,0 +1,59 @@
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def lock(f, blocking=True):
+    """
+    Take an exclusive advisory lock on the open file `f`. Without `blocking`,
+    returns False instead of waiting when another process holds it.
+    """
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+    f.seek(0)
+    try:
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+    except OSError:
+        if blocking:
+            raise
+        return False
+    return True
+
+
+def unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def locked(path):
+    """Hold the lock on `path` (created if missing) for the duration of the block."""
+    with open(path, "a+b") as f:
+        lock(f)
+        try:
+            yield
+        finally:
+            unlock(f)
+
+
+def held_elsewhere(path):
+    """Whether another process holds the lock on `path`; False once that process is gone."""
+    if not os.path.exists(path):
+        return False
+    with open(path, "a+b") as f:
+        if not lock(f, blocking=False):
+            return True
+        unlock(f)
+        return False
@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+from metrics import inc, log
+from deadline import PhaseError
+from file_lock import held_elsewhere, lock, locked, unlock
+
+TERMINAL_STATES = ("succeeded", "failed")
+
+# How often wait() re-reads a job that another server process is building.
+FOREIGN_POLL_S = 1.0
+
+
+class JobManager:
+    """
+    Queue of deck builds that run in the background.
+
+    Each submitted job is stored as one JSON file under `jobs_dir` and updated as
+    it moves through its phases, so status and results survive a restart.
+
+    Several server processes may share `jobs_dir`. Each job records its owner,
+    and every live manager holds a lock on an owner file under `jobs_dir/owners`
+    for as long as it runs. On start, unfinished jobs whose owner no longer holds
+    its lock are taken over and queued again; jobs of live owners are left to
+    them, and get() and wait() follow their progress from disk.
+
+    `runner(params, progress)` does the actual work: it awaits
+    progress(phase, percent) as phases start and returns (lines, artifacts).
+    A finished job keeps its parameters without the deck content, and is
+    removed `ttl` seconds after it finished; expired jobs are pruned on load
+    and whenever a job is submitted or updated.
+    """
+
+    def __init__(self, runner, jobs_dir, workers=2, ttl=86400):
+        self.runner = runner
+        self.jobs_dir = jobs_dir
+        self.workers = max(1, int(workers))
+        self.ttl = ttl
+        self._jobs = {}
+        self._listeners = {}
+        self._queue = None
+        self._tasks = []
+        self._changed = None
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._owner_lock = None
+
+    @classmethod
+    def from_env(cls, runner, base_dir):
+        return cls(
+            runner,
+            os.environ.get("MARP_JOBS_DIR") or os.path.join(base_dir, "output_slides", ".jobs"),
+            workers=int(os.environ.get("MARP_JOB_WORKERS", "2")),
+            ttl=float(os.environ.get("MARP_JOB_TTL_S", "86400")),
+        )
+
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _owner_path(self, owner):
+        return os.path.join(self.jobs_dir, "owners", f"{owner}.lock")
+
+    def _read(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, job):
+        temp_path = self._path(job["id"]) + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(temp_path, self._path(job["id"]))
+
+    def _load(self):
+        now = time.time()
+        for name in sorted(os.listdir(self.jobs_dir)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.jobs_dir, name)
+            job = self._read(path)
+            if job is None:
+                continue
+            if self._expired(job, now):
+                os.remove(path)
+                continue
+            self._jobs[job["id"]] = job
+
+    def _expired(self, job, now):
+        return job["status"] in TERMINAL_STATES and now - job["updated"] > self.ttl
+
+    def _prune(self, now):
+        for job_id in [job_id for job_id, job in self._jobs.items() if self._expired(job, now)]:
+            del self._jobs[job_id]
+            self._listeners.pop(job_id, None)
+            try:
+                os.remove(self._path(job_id))
+            except OSError:
+                pass
+
+    async def start(self):
+        if self._queue is not None:
+            return
+        os.makedirs(os.path.join(self.jobs_dir, "owners"), exist_ok=True)
+        self._queue = asyncio.Queue()
+        self._changed = asyncio.Condition()
+        # Owner files are created, locked and swept under one lock, so a manager that
+        # is starting up can never look dead to another one.
+        with locked(os.path.join(self.jobs_dir, "jobs.lock")):
+            self._owner_lock = open(self._owner_path(self.owner), "a+b")
+            lock(self._owner_lock)
+            self._load()
+            interrupted = sorted(
+                (job for job in self._jobs.values() if job["status"] not in TERMINAL_STATES),
+                key=lambda job: job["created"]
+            )
+            for job in interrupted:
+                owner = job.get("owner")
+                if owner and held_elsewhere(self._owner_path(owner)):
+                    continue
+                log("Jobs", f"Re-queueing job {job['id']}, its server is gone")
+                job.update(status="queued", phase="queued", percent=0, owner=self.owner)
+                self._save(job)
+                self._queue.put_nowait(job["id"])
+            for name in os.listdir(os.path.join(self.jobs_dir, "owners")):
+                path = os.path.join(self.jobs_dir, "owners", name)
+                if name != f"{self.owner}.lock" and not held_elsewhere(path):
+                    os.remove(path)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, params, listener=None):
+        """Queue a build and return its job record; `listener(job)` is awaited on every update."""
+        await self.start()
+        now = time.time()
+        self._prune(now)
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "params": params,
+            "status": "queued",
+            "phase": "queued",
+            "percent": 0,
+            "lines": [],
+            "artifacts": {},
+            "error": None,
+            "created": now,
+            "updated": now,
+            "owner": self.owner,
+        }
+        self._jobs[job["id"]] = job
+        if listener is not None:
+            self._listeners[job["id"]] = listener
+        self._save(job)
+        self._queue.put_nowait(job["id"])
+        inc("marp_jobs_total", status="queued")
+        return job
+
+    def get(self, job_id):
+        """A job's record; jobs of other server processes are re-read from disk."""
+        job = self._jobs.get(job_id)
+        if job is None or (job.get("owner") != self.owner and job["status"] not in TERMINAL_STATES):
+            stored = self._read(self._path(job_id))
+            if stored is not None:
+                job = self._jobs[job_id] = stored
+        return job
+
+    def position(self, job_id):
+        """1-based place in this server's queue, or None once the job has left it."""
+        waiting = [
+            job for job in self._jobs.values() if job["status"] == "queued" and job.get("owner") == self.owner
+        ]
+        waiting.sort(key=lambda job: job["created"])
+        for index, job in enumerate(waiting):
+            if job["id"] == job_id:
+                return index + 1
+        return None
+
+    async def _update(self, job, **changes):
+        now = time.time()
+        job.update(changes, updated=now)
+        if job["status"] in TERMINAL_STATES:
+            # The deck content is only needed to run the job.
+            job["params"].pop("content", None)
+        self._save(job)
+        self._prune(now)
+        async with self._changed:
+            self._changed.notify_all()
+        listener = self._listeners.get(job["id"])
+        if listener is not None:
+            try:
+                await listener(job)
+            except Exception as e:
+                log("Jobs", f"Dropping listener of job {job['id']}: {e}")
+                self._listeners.pop(job["id"], None)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "queued":
+                continue
+
+            async def progress(phase, percent, job=job):
+                await self._update(job, phase=phase, percent=percent)
+
+            await self._update(job, status="running", phase="normalizing", percent=1)
+            try:
+                lines, artifacts = await self.runner(job["params"], progress)
+                failed = any(line.startswith("❌") for line in lines)
+                await self._update(
+                    job, status="failed" if failed else "succeeded", phase="done", percent=100,
+                    lines=lines, artifacts=artifacts
+                )
+            except Exception as e:
+                log("Jobs", f"Job {job_id} failed: {e}")
+                error = e.to_dict() if isinstance(e, PhaseError) else {
+                    "phase": job["phase"], "message": str(e), "timedOut": False
+                }
+                await self._update(job, status="failed", phase="done", percent=100,
+                                   lines=[f"❌ Error: {e}"], error=error)
+            inc("marp_jobs_total", status=job["status"])
+            self._listeners.pop(job_id, None)
+
+    async def wait(self, job_id, timeout, on_update=None):
+        """Wait up to `timeout` seconds for a job to finish, awaiting on_update(job) on every change."""
+        job = self.get(job_id)
+        if job is None or self._changed is None:
+            return job
+        # Another process's job never notifies this one, so its file is polled instead.
+        foreign = job.get("owner") != self.owner
+        deadline = time.monotonic() + timeout
+        while job["status"] not in TERMINAL_STATES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            async with self._changed:
+                try:
+                    await asyncio.wait_for(
+                        self._changed.wait(), timeout=min(remaining, FOREIGN_POLL_S) if foreign else remaining
+                    )
+                except asyncio.TimeoutError:
+                    if not foreign:
+                        break
+            if foreign:
+                job = self.get(job_id)
+            if on_update is not None:
+                await on_update(job)
+        return job
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        if self._owner_lock is not None:
+            # Jobs left unfinished are taken over by the next manager that starts.
+            unlock(self._owner_lock)
+            self._owner_lock.close()
+            self._owner_lock = None
+            try:
+                os.remove(self._owner_path(self.owner))
+            except OSError:
+                pass
@@ -0,0 +1,296 @@
+import os
+import re
+import json
+import hashlib
+import unicodedata
+
+# Bump when the calibration format or the calibration deck changes.
+CALIBRATION_VERSION = 1
+
+# Extra width assumed for estimated text, covering bold runs, kerning and the like.
+WIDTH_SLACK = 1.05
+
+# Kinds the estimator can lay out, and the extra kinds that may only precede them.
+TARGET_KINDS = ("p", "h1", "h2", "h3", "h4", "h5", "h6", "li0")
+PREV_KINDS = ("start", "p", "h1", "h2", "h3", "h4", "h5", "h6", "li0", "li1", "li2", "table", "code", "math")
+
+SAMPLE_TEXT = "Sample"
+PREV_SAMPLES = {
+    "p": "Sample paragraph.",
+    "h1": "# Sample", "h2": "## Sample", "h3": "### Sample",
+    "h4": "#### Sample", "h5": "##### Sample", "h6": "###### Sample",
+    "li0": "- Sample",
+    "li1": "- Sample\n  - Sample",
+    "li2": "- Sample\n  - Sample\n    - Sample",
+    "table": "| Sample | Sample |\n|---|---|\n| Sample | Sample |",
+    "code": "```\nSample\n```",
+    "math": "$$\nx^2\n$$",
+}
+TARGET_MARKERS = {"p": "", "li0": "- ", **{f"h{n}": "#" * n + " " for n in range(1, 7)}}
+
+# Content that needs a real layout engine: inline/display math, HTML, images,
+# footnotes, blockquotes, table rows, fences, rules and setext underlines.
+OPAQUE_RE = re.compile(r'\$|<|!\[|\\[(\[]|\[\^|^ *(?:>|\||```|~~~|[=*_-]{3,} *$)', re.MULTILINE)
+# Lines that start a block other than a paragraph: blockquotes, raw HTML, table
+# rows, rules and setext underlines. A chunk holding one does not end in a <p>.
+BLOCK_LINE_RE = re.compile(r'^ *(?:>|<|\||[=*_-]{3,} *$)', re.MULTILINE)
+LIST_MARKER_RE = re.compile(r'^[ \t]*(?:[\-\*\+]|\d+\.)\s+')
+HEADING_MARKER_RE = re.compile(r'^#{1,6}\s+')
+LINK_RE = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+ESCAPE_RE = re.compile(r'\\(.)')
+EMPHASIS_RE = re.compile(r'[*_~`]')
+
+# Per probe: the text box width and the font metrics of the element it measures.
+CALIBRATE_JS = """
+() => {
+    const blockTags = ['li', 'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'tr', 'div', 'blockquote', 'pre'];
+    const canvas = document.createElement('canvas').getContext('2d');
+    const ascii = [];
+    for (let c = 32; c < 127; c++) ascii.push(String.fromCharCode(c));
+    const out = {};
+    document.querySelectorAll('.m-probe').forEach(p => {
+        let target = p.parentElement;
+        while (target && !blockTags.includes(target.tagName.toLowerCase()) && target.tagName.toLowerCase() !== 'section') {
+            target = target.parentElement;
+        }
+        if (!target) return;
+        const style = window.getComputedStyle(target);
+        canvas.font = `${style.fontStyle} ${style.fontWeight} ${style.fontSize} ${style.fontFamily}`;
+        const spacing = parseFloat(style.letterSpacing) || 0;
+        const width = (s) => canvas.measureText(s).width + spacing * s.length;
+        out[p.dataset.idx] = {
+            width: target.clientWidth - (parseFloat(style.paddingLeft) || 0) - (parseFloat(style.paddingRight) || 0),
+            ascii: ascii.map(width),
+            wide: width('\\u4e2d'),
+            transform: style.textTransform,
+        };
+    });
+    return out;
+}
+"""
+
+
+def calibration_deck(chunk_text):
+    """
+    Build the calibration sample: one probe window per (previous kind, target kind)
+    pair holding the previous sample, two one-line targets and a three-line target.
+    Returns (chunks, windows, layout) where layout lists, per window, the kinds and
+    the chunk indices of the previous sample's last chunk and the three targets.
+    """
+    chunks, windows, layout = [], [], []
+    for prev_kind in PREV_KINDS:
+        for kind in TARGET_KINDS:
+            marker = TARGET_MARKERS[kind]
+            targets = [marker + SAMPLE_TEXT, marker + SAMPLE_TEXT, marker + "<br>".join([SAMPLE_TEXT] * 3)]
+            # List items continue a tight list; everything else is its own block.
+            joiner = "\n" if kind == "li0" else "\n\n"
+            text = joiner.join(targets)
+            if prev_kind != "start":
+                text = PREV_SAMPLES[prev_kind] + ("\n" if prev_kind == kind == "li0" else "\n\n") + text
+            window_chunks = chunk_text(text)
+            offset = len(chunks)
+            chunks.extend(window_chunks)
+            windows.append((offset, len(chunks)))
+            last = len(chunks) - 1
+            layout.append({
+                "prev": prev_kind,
+                "kind": kind,
+                "prev_idx": last - 3 if prev_kind != "start" else None,
+                "targets": [last - 2, last - 1, last],
+            })
+    return chunks, windows, layout
+
+
+def fit_calibration(layout, measured, usable_height):
+    """
+    Turn the measured calibration deck into the model: per target kind its text
+    width, font metrics and line height, and the offset a one-line target adds
+    after each kind of previous element.
+    """
+    ys = {data["idx"]: data["y"] for data in measured["probes"]}
+    metrics = measured["calibration"]
+    transitions = {}
+    line_heights = {}
+    kinds = {}
+    for window in layout:
+        first, second, third = window["targets"]
+        prev_y = ys.get(window["prev_idx"], 0.0) if window["prev_idx"] is not None else 0.0
+        transitions[f"{window['prev']}>{window['kind']}"] = ys[first] - prev_y
+        line_heights.setdefault(window["kind"], []).append((ys[third] - ys[second] - (ys[second] - ys[first])) / 2)
+        if window["prev"] == "start":
+            kinds[window["kind"]] = metrics[str(first)]
+    for kind, samples in line_heights.items():
+        samples.sort()
+        kinds[kind]["line"] = samples[len(samples) // 2]
+    return {
+        "version": CALIBRATION_VERSION,
+        "usableHeight": usable_height,
+        "kinds": kinds,
+        "transitions": transitions,
+    }
+
+
+def _text_lines(text, kind):
+    """Source lines of a chunk as displayed text (markers and inline markup removed)."""
+    lines = []
+    for i, line in enumerate(text.split("\n")):
+        if i == 0:
+            line = HEADING_MARKER_RE.sub("", line) if kind.startswith("h") else LIST_MARKER_RE.sub("", line)
+        line = LINK_RE.sub(r"\1", line.strip())
+        line = EMPHASIS_RE.sub("", ESCAPE_RE.sub(r"\1", line))
+        lines.append(line)
+    return lines
+
+
+def chunk_kind(chunks, idx):
+    """
+    Classify a chunk as (kind, confident). `kind` names the element the chunk ends
+    with, or None when it has no calibrated counterpart; `confident` says whether
+    its height can be estimated. Tables, code, math, images, HTML and nested or
+    loose lists are left to the browser; blockquotes, raw HTML blocks and rules
+    also get no kind, so the chunk after them is measured as well.
+    """
+    chunk = chunks[idx]
+    if chunk.type != "text":
+        return "table", False
+    text = chunk.text
+    head = text.lstrip()[:3]
+    if head.startswith(("```", "~~~")):
+        return "code", False
+    if head.startswith(("$$", "\\[")):
+        return "math", False
+
+    lines = text.split("\n")
+    opaque = OPAQUE_RE.search(text) is not None
+    list_match = LIST_MARKER_RE.match(lines[0])
+    if list_match:
+        depth = len(chunk.context)
+        kind = f"li{depth}" if depth <= 2 else None
+        nxt = chunks[idx + 1] if idx + 1 < len(chunks) else None
+        prev = chunks[idx - 1] if idx > 0 else None
+        has_children = (nxt is not None and nxt.type == "text" and len(nxt.context) > depth
+                        and LIST_MARKER_RE.match(nxt.text))
+        loose = chunk.blank_before and prev is not None and prev.type == "text" and LIST_MARKER_RE.match(prev.text)
+        return kind, kind == "li0" and not (opaque or has_children or loose)
+
+    if chunk.context or lines[0][:1].isspace() or BLOCK_LINE_RE.search(text):
+        return None, False
+    if chunk.level:
+        if len(lines) > 1:
+            # A heading with text straight under it ends in a paragraph.
+            return "p", False
+        return f"h{chunk.level}", not opaque
+    confident = not opaque and not any(line[:1].isspace() for line in lines[1:])
+    return "p", confident
+
+
+class LayoutEstimator:
+    """Analytic chunk heights from a theme calibration (see fit_calibration)."""
+
+    def __init__(self, calibration):
+        self.calibration = calibration
+        self.transitions = calibration["transitions"]
+        self.kinds = calibration["kinds"]
+        self._widths = {}
+
+    def _char_width(self, metrics, char):
+        code = ord(char)
+        if 32 <= code < 127:
+            return metrics["ascii"][code - 32]
+        if unicodedata.east_asian_width(char) in ("W", "F"):
+            return metrics["wide"]
+        return metrics["ascii"][ord("n") - 32]
+
+    def line_count(self, kind, line):
+        """Lines a single hard line of text wraps into, breaking at spaces and between wide glyphs."""
+        metrics = self.kinds[kind]
+        if metrics.get("transform") == "uppercase":
+            line = line.upper()
+        box = metrics["width"]
+        if not line or box <= 0:
+            return 1
+        space = metrics["ascii"][0] * WIDTH_SLACK
+        lines = 1
+        used = 0.0
+        pending = 0.0
+        word = 0.0
+
+        def place(width):
+            nonlocal lines, used, pending
+            if used and used + pending + width > box:
+                lines += 1
+                used = 0.0
+            elif used:
+                used += pending
+            if width > box:
+                # An unbreakable run wider than the box overflows onto extra lines.
+                lines += int(width // box)
+                width = width % box
+            used += width
+            pending = 0.0
+
+        for char in line:
+            if char == " ":
+                if word:
+                    place(word)
+                    word = 0.0
+                pending = space
+            elif ord(char) > 0x2e7f and unicodedata.east_asian_width(char) in ("W", "F"):
+                if word:
+                    place(word)
+                    word = 0.0
+                place(self._char_width(metrics, char) * WIDTH_SLACK)
+            else:
+                word += self._char_width(metrics, char) * WIDTH_SLACK
+        if word:
+            place(word)
+        return lines
+
+    def delta(self, kind, prev_kind, text):
+        """Height a chunk of `kind` adds after an element of `prev_kind`."""
+        lines = sum(self.line_count(kind, line) for line in _text_lines(text, kind))
+        return self.transitions[f"{prev_kind}>{kind}"] + (lines - 1) * self.kinds[kind]["line"]
+
+
+class CalibrationStore:
+    """
+    Theme calibrations keyed by theme fingerprint, kept in memory and, when
+    `directory` is set, as one JSON file per theme so they survive restarts.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._entries = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """None unless MARP_LAYOUT_ESTIMATOR=1, so by default every chunk goes to the browser."""
+        if os.environ.get("MARP_LAYOUT_ESTIMATOR", "0") != "1":
+            return None
+        return cls(os.environ.get("MARP_CALIBRATION_DIR") or None)
+
+    def _path(self, theme_key):
+        return os.path.join(self.directory, hashlib.sha256(theme_key.encode("utf-8")).hexdigest()[:32] + ".json")
+
+    def get(self, theme_key):
+        calibration = self._entries.get(theme_key)
+        if calibration is None and self.directory:
+            try:
+                with open(self._path(theme_key), encoding="utf-8") as f:
+                    calibration = json.load(f)
+            except (OSError, ValueError):
+                return None
+            if calibration.get("version") != CALIBRATION_VERSION:
+                return None
+            self._entries[theme_key] = calibration
+        return calibration
+
+    def put(self, theme_key, calibration):
+        self._entries[theme_key] = calibration
+        if self.directory:
+            temp_path = self._path(theme_key) + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(calibration, f)
+            os.replace(temp_path, self._path(theme_key))
@@ -0,0 +1,229 @@
+import os
+import json
+import shutil
+import asyncio
+from metrics import inc, log, span
+from measure_cache import available_themes, theme_fingerprint
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "marp_worker.js")
+
+# Rendered decks travel as a single JSON line, so the pipe must accept large lines.
+STREAM_LIMIT = 64 * 1024 * 1024
+
+
+class MarpRendererError(Exception):
+    pass
+
+
+def build_html_document(rendered, base_href=None, extra_css=""):
+    """Wrap a render() result into a standalone HTML document that can be measured or printed."""
+    base = f'<base href="{base_href}">' if base_href else ""
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"UTF-8\">"
+        f"{base}<style>{rendered['css']}</style><style>body {{ margin: 0; }}{extra_css}</style>"
+        f"</head><body>{rendered['html']}</body></html>"
+    )
+
+
+class MarpRenderer:
+    """
+    Async client for the persistent marp_worker.js sidecar.
+
+    Markdown is converted to HTML/CSS in memory by a single long-lived Node
+    process instead of spawning the marp CLI for every pass. The worker is
+    started on first use and restarted automatically if it exits; a request
+    that was in flight when the worker died is retried once on the new one.
+    After `max_restarts` crashes without a successful reply the client gives up.
+    The worker reads the theme directory when it starts; render() reloads it
+    whenever a theme file was added, removed or changed since, like the CLI
+    reading --theme-set on every run.
+    """
+
+    def __init__(self, node_bin, themes_dir=None, env=None, request_timeout=60, max_restarts=5):
+        self.node_bin = node_bin
+        self.themes_dir = themes_dir
+        self.env = env
+        self.request_timeout = request_timeout
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.requests = 0
+        self._proc = None
+        self._reader = None
+        self._pending = {}
+        self._next_id = 0
+        self._lock = asyncio.Lock()
+        self._reload_lock = asyncio.Lock()
+        # Fingerprints of the theme files the running worker has loaded.
+        self._loaded_themes = None
+
+    @classmethod
+    def discover(cls, base_dir, env=None):
+        """Return a renderer if node and @marp-team/marp-core are installed, else None."""
+        node_bin = shutil.which("node", path=(env or os.environ).get("PATH"))
+        core_dir = os.path.join(base_dir, "node_modules", "@marp-team", "marp-core")
+        if not node_bin or not os.path.isdir(core_dir):
+            return None
+        themes_dir = os.path.join(base_dir, "themes")
+        return cls(node_bin, themes_dir if os.path.isdir(themes_dir) else None, env=env)
+
+    @property
+    def running(self):
+        return self._proc is not None and self._proc.returncode is None
+
+    async def start(self):
+        async with self._lock:
+            if self.running:
+                return
+            if self._proc is not None:
+                if self.restarts >= self.max_restarts:
+                    raise MarpRendererError("Marp worker keeps crashing, giving up")
+                self.restarts += 1
+                log("MarpRenderer", f"Restarting worker (restart #{self.restarts})")
+            cmd = [self.node_bin, WORKER_SCRIPT]
+            if self.themes_dir:
+                cmd.append(self.themes_dir)
+            # Taken before the worker reads the files, so an edit made meanwhile still triggers a reload.
+            self._loaded_themes = self._theme_state()
+            self._proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=None,
+                env=self.env, limit=STREAM_LIMIT
+            )
+            self._pending = {}
+            self._reader = asyncio.create_task(self._read_loop(self._proc, self._pending))
+
+    async def _read_loop(self, proc, pending):
+        try:
+            while True:
+                line = await proc.stdout.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                future = pending.pop(message.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in message:
+                    future.set_exception(MarpRendererError(message["error"]))
+                else:
+                    future.set_result(message.get("result"))
+        finally:
+            await proc.wait()
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionResetError(f"Marp worker exited with code {proc.returncode}"))
+            pending.clear()
+
+    async def _call(self, method, params=None):
+        await self.start()
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        payload = json.dumps({"id": request_id, "method": method, "params": params or {}})
+        try:
+            self._proc.stdin.write(payload.encode("utf-8") + b"\n")
+            await self._proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            self._pending.pop(request_id, None)
+            raise ConnectionResetError(str(e))
+        try:
+            result = await asyncio.wait_for(future, timeout=self.request_timeout)
+            self.restarts = 0
+            return result
+        except asyncio.TimeoutError:
+            self._pending.pop(request_id, None)
+            # A hung worker is useless for every later request, so replace it.
+            await self._kill()
+            raise MarpRendererError(f"Marp worker did not answer {method} within {self.request_timeout}s")
+
+    async def call(self, method, params=None):
+        with span("marp_worker.call", method=method):
+            try:
+                return await self._call(method, params)
+            except ConnectionResetError:
+                inc("marp_retries_total", component="marp_worker")
+                try:
+                    return await self._call(method, params)
+                except ConnectionResetError as e:
+                    raise MarpRendererError(str(e))
+
+    def _theme_state(self):
+        if not self.themes_dir:
+            return ()
+        _, local = available_themes(self.themes_dir)
+        return tuple(theme_fingerprint(name, self.themes_dir) for name in local)
+
+    async def _sync_themes(self):
+        """Reload the worker's themes if the files changed since it loaded them."""
+        if not self.themes_dir or not self.running or self._theme_state() == self._loaded_themes:
+            return
+        async with self._reload_lock:
+            current = self._theme_state()
+            if self.running and current != self._loaded_themes:
+                log("MarpRenderer", "Theme files changed, reloading them in the worker")
+                await self.call("reload")
+                self._loaded_themes = current
+
+    async def render(self, markdown: str, html: bool = False, inline_svg: bool = False, script: bool = False):
+        """
+        Convert Markdown to {"html", "css", "comments"} without touching disk.
+
+        `inline_svg` wraps every slide in an SVG like the CLI's exports do, which
+        advanced backgrounds need; the probe keeps plain sections. `script` adds
+        marp-core's browser script to the html, which the CLI's output also runs:
+        without it, fit headings and wide code or math are not scaled down.
+        """
+        await self._sync_themes()
+        self.requests += 1
+        return await self.call(
+            "render", {"markdown": markdown, "html": html, "inlineSVG": inline_svg, "script": script}
+        )
+
+    async def render_document(self, markdown: str, html: bool = False, base_href: str = None, script: bool = False):
+        """Render Markdown straight into a standalone HTML document."""
+        return build_html_document(await self.render(markdown, html=html, script=script), base_href=base_href)
+
+    async def write_pptx(self, image_paths, notes, width_px, height_px, output_path):
+        """Pack pre-rendered slide images (plus speaker notes) into a PPTX file."""
+        return await self.call("pptx", {
+            "images": list(image_paths),
+            "notes": list(notes),
+            "width": width_px / 96,
+            "height": height_px / 96,
+            "path": output_path,
+        })
+
+    async def reload_themes(self):
+        current = self._theme_state()
+        result = await self.call("reload")
+        self._loaded_themes = current
+        return result
+
+    async def ping(self):
+        return await self.call("ping")
+
+    async def _kill(self):
+        if self.running:
+            try:
+                self._proc.kill()
+            except ProcessLookupError:
+                pass
+        if self._reader is not None:
+            try:
+                await self._reader
+            except Exception:
+                pass
+
+    async def close(self):
+        proc = self._proc
+        if proc is not None and proc.returncode is None:
+            try:
+                proc.stdin.close()
+                await asyncio.wait_for(proc.wait(), timeout=5)
+            except Exception:
+                pass
+        await self._kill()
+        self._proc = None
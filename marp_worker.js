@@ -0,0 +1,115 @@
+#!/usr/bin/env node
+// Long-lived Marp renderer used by marp_renderer.py.
+//
+// Protocol: one JSON object per line on stdin, one JSON reply per line on stdout.
+//   {"id": 1, "method": "render", "params": {"markdown": "...", "html": true, "inlineSVG": false, "script": true}}
+//   -> {"id": 1, "result": {"html": "...", "css": "...", "comments": [...]}}
+//   -> {"id": 1, "error": "message"}
+// Methods: render, pptx (pack slide images into a deck), reload (re-read the
+// theme directory), ping.
+const fs = require('fs')
+const path = require('path')
+const readline = require('readline')
+const { Marp } = require('@marp-team/marp-core')
+
+const themesDir = process.argv[2]
+let themeCss = []
+let renderers = {}
+
+function loadThemes() {
+  themeCss = []
+  renderers = {}
+  if (!themesDir || !fs.existsSync(themesDir)) return []
+  const names = []
+  for (const file of fs.readdirSync(themesDir).sort()) {
+    if (!file.endsWith('.css')) continue
+    themeCss.push(fs.readFileSync(path.join(themesDir, file), 'utf8'))
+    names.push(file.slice(0, -4))
+  }
+  return names
+}
+
+function getMarp(allowHtml, inlineSVG, script) {
+  const key = `${allowHtml ? 'html' : 'default'}:${inlineSVG ? 'svg' : 'plain'}:${script ? 'script' : 'static'}`
+  if (!renderers[key]) {
+    // Same conversion the CLI does, minus the bespoke template. With `script`, the
+    // html carries marp-core's browser helper inline, as the CLI's output does: it
+    // runs auto-scaling (<!-- fit --> headings, shrinking wide code and math).
+    const options = { inlineSVG: !!inlineSVG, script: script ? { source: 'inline' } : false }
+    if (allowHtml) options.html = true
+    const marp = new Marp(options)
+    for (const css of themeCss) {
+      try {
+        marp.themeSet.add(css)
+      } catch (e) {
+        process.stderr.write(`marp_worker: skipped theme (${e.message})\n`)
+      }
+    }
+    renderers[key] = marp
+  }
+  return renderers[key]
+}
+
+function coreVersion() {
+  try {
+    return require('@marp-team/marp-core/package.json').version
+  } catch (e) {
+    return 'unknown'
+  }
+}
+
+const handlers = {
+  render(params) {
+    const { html, css, comments } = getMarp(!!params.html, !!params.inlineSVG, !!params.script).render(params.markdown || '')
+    return { html, css, comments }
+  },
+  async pptx(params) {
+    // Same approach as the CLI: one full-bleed slide image per page, notes attached.
+    const PptxGenJS = require('pptxgenjs')
+    const pptx = new PptxGenJS()
+    pptx.defineLayout({ name: 'MARP', width: params.width, height: params.height })
+    pptx.layout = 'MARP'
+    params.images.forEach((image, i) => {
+      const slide = pptx.addSlide()
+      slide.background = { path: image }
+      const note = (params.notes || [])[i]
+      if (note) slide.addNotes(note)
+    })
+    await pptx.writeFile({ fileName: params.path })
+    return { path: params.path, slides: params.images.length }
+  },
+  reload() {
+    return { themes: loadThemes() }
+  },
+  ping() {
+    return { version: coreVersion(), pid: process.pid }
+  },
+}
+
+function reply(message) {
+  process.stdout.write(JSON.stringify(message) + '\n')
+}
+
+loadThemes()
+
+readline.createInterface({ input: process.stdin, crlfDelay: Infinity }).on('line', (line) => {
+  if (!line.trim()) return
+  let request
+  try {
+    request = JSON.parse(line)
+  } catch (e) {
+    reply({ id: null, error: `Invalid request: ${e.message}` })
+    return
+  }
+  const handler = handlers[request.method]
+  if (!handler) {
+    reply({ id: request.id, error: `Unknown method: ${request.method}` })
+    return
+  }
+  Promise.resolve()
+    .then(() => handler(request.params || {}))
+    .then(
+      (result) => reply({ id: request.id, result }),
+      (e) => reply({ id: request.id, error: e.stack || String(e) })
+    )
+})
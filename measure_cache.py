@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from collections import OrderedDict
+
+
+BUILTIN_THEMES = ("default", "gaia", "uncover")
+
+# Bump when the probe renders differently, so persisted heights are measured again.
+HEIGHTS_VERSION = 2
+
+# css path -> (mtime_ns, size, fingerprint), so unchanged theme files are not re-read and re-hashed.
+_theme_hashes = {}
+
+
+def theme_fingerprint(theme: str, themes_dir: str = None):
+    """Theme name plus a hash of its CSS; built-in themes are keyed by name only."""
+    if themes_dir:
+        css_file = os.path.join(themes_dir, f"{theme}.css")
+        try:
+            stat = os.stat(css_file)
+        except OSError:
+            return f"{theme}:builtin"
+        cached = _theme_hashes.get(css_file)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        with open(css_file, "rb") as f:
+            fingerprint = f"{theme}:{hashlib.sha256(f.read()).hexdigest()}"
+        _theme_hashes[css_file] = (stat.st_mtime_ns, stat.st_size, fingerprint)
+        return fingerprint
+    return f"{theme}:builtin"
+
+
+def available_themes(themes_dir: str = None):
+    """Built-in theme names followed by the local .css themes in `themes_dir`."""
+    local = []
+    if themes_dir and os.path.isdir(themes_dir):
+        local = sorted(name[:-4] for name in os.listdir(themes_dir) if name.endswith(".css"))
+    return list(BUILTIN_THEMES), local
+
+
+def _chunk_repr(chunk):
+    return [chunk.type, chunk.text, chunk.context, chunk.header, chunk.blank_before]
+
+
+def block_key(theme_key: str, lead_chunks, block_chunks):
+    """
+    Content address of one layout block.
+
+    A block's heights depend on its own chunks (text, type, list context, table
+    header), on the theme, and - through margin collapsing - on the block
+    rendered right before it, so all of those go into the key.
+    """
+    payload = json.dumps(
+        [HEIGHTS_VERSION, theme_key, [_chunk_repr(c) for c in lead_chunks], [_chunk_repr(c) for c in block_chunks]],
+        ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class HeightCache:
+    """
+    Measured block heights keyed by block_key().
+
+    Entries live in an in-memory LRU and, when `db_path` is set, in a SQLite
+    store so they survive restarts. Values are the per-chunk height deltas of
+    a block, which Phase 3 turns back into probe offsets with a prefix sum.
+    """
+
+    def __init__(self, max_entries=4096, db_path=None):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._usable = {}
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS heights (key TEXT PRIMARY KEY, deltas TEXT, updated REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS usable (theme_key TEXT PRIMARY KEY, height REAL)")
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.environ.get("MARP_HEIGHT_CACHE_SIZE", "4096")),
+            db_path=os.environ.get("MARP_HEIGHT_CACHE_DB") or None,
+        )
+
+    def _remember(self, key, deltas):
+        self._entries[key] = deltas
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        deltas = self._entries.get(key)
+        if deltas is not None:
+            self._entries.move_to_end(key)
+        elif self._db is not None:
+            row = self._db.execute("SELECT deltas FROM heights WHERE key = ?", (key,)).fetchone()
+            if row:
+                deltas = json.loads(row[0])
+                self._remember(key, deltas)
+        if deltas is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return deltas
+
+    def put(self, key, deltas):
+        self.put_many([(key, deltas)])
+
+    def put_many(self, items):
+        """Store (key, deltas) pairs, written to SQLite in a single transaction."""
+        rows = []
+        now = time.time()
+        for key, deltas in items:
+            deltas = list(deltas)
+            self._remember(key, deltas)
+            rows.append((key, json.dumps(deltas), now))
+        if self._db is not None and rows:
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO heights (key, deltas, updated) VALUES (?, ?, ?)", rows)
+
+    def get_usable_height(self, theme_key):
+        height = self._usable.get(theme_key)
+        if height is None and self._db is not None:
+            row = self._db.execute("SELECT height FROM usable WHERE theme_key = ?", (theme_key,)).fetchone()
+            if row:
+                height = self._usable[theme_key] = row[0]
+        return height
+
+    def put_usable_height(self, theme_key, height):
+        self._usable[theme_key] = height
+        if self._db is not None:
+            self._db.execute("INSERT OR REPLACE INTO usable (theme_key, height) VALUES (?, ?)", (theme_key, height))
+            self._db.commit()
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
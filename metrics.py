@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+import contextvars
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the span duration histogram buckets.
+SPAN_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+COUNTERS = {
+    "marp_decks_total": "Decks built, by outcome.",
+    "marp_chunks_total": "Chunks produced by the splitter.",
+    "marp_probes_total": "Chunks measured in the browser (cache misses included, hits excluded).",
+    "marp_slides_total": "Slides emitted by the splitter.",
+    "marp_height_cache_hits_total": "Layout blocks whose heights came from the cache.",
+    "marp_height_cache_misses_total": "Layout blocks that had to be measured.",
+    "marp_estimated_blocks_total": "Layout blocks sized by the layout estimator instead of the browser.",
+    "marp_retries_total": "Operations retried after a failure, by component.",
+    "marp_fallbacks_total": "Times the marp CLI replaced the Marp worker, by stage.",
+    "marp_readiness_timeouts_total": "Measurements that hit the readiness bound.",
+    "marp_browser_recycles_total": "Browsers taken out of rotation, by reason.",
+    "marp_jobs_total": "Background jobs queued and finished, by state.",
+    "marp_artifact_lookups_total": "Artifact store lookups, by result.",
+    "marp_artifact_evictions_total": "Stored artifacts evicted for size or age.",
+    "marp_images_downscaled_total": "Images resized to slide resolution for export.",
+}
+
+_trace = contextvars.ContextVar("marp_trace", default=None)
+
+
+def log(component: str, message: str):
+    """The server's debug log line; stdout is reserved for the MCP protocol."""
+    sys.stderr.write(f"DEBUG: [{component}] {message}\n")
+
+
+def _label_text(labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels)
+
+
+class Registry:
+    """
+    Process-wide counters and span-duration histograms, rendered in the
+    Prometheus text format. Collectors add point-in-time gauges (pool size,
+    cache entries, ...) computed when the metrics are read.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.spans = {}
+        self.collectors = []
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, span_name, seconds, labels=()):
+        key = (span_name, labels)
+        entry = self.spans.get(key)
+        if entry is None:
+            entry = self.spans[key] = {"buckets": [0] * len(SPAN_BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(SPAN_BUCKETS):
+            if seconds <= bound:
+                entry["buckets"][i] += 1
+        entry["sum"] += seconds
+        entry["count"] += 1
+
+    def add_collector(self, collector):
+        """Register a callable returning {gauge_name: value} at scrape time."""
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for name, help_text in COUNTERS.items():
+            samples = [(labels, value) for (n, labels), value in self.counters.items() if n == name]
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            if not samples:
+                lines.append(f"{name} 0")
+            for labels, value in sorted(samples):
+                lines.append(f"{name}{{{_label_text(labels)}}} {value}" if labels else f"{name} {value}")
+
+        lines += [
+            "# HELP marp_span_seconds Duration of traced phases and subprocess calls.",
+            "# TYPE marp_span_seconds histogram",
+        ]
+        for (span_name, labels), entry in sorted(self.spans.items()):
+            base = _label_text((("span", span_name),) + labels)
+            for bound, count in zip(SPAN_BUCKETS, entry["buckets"]):
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'marp_span_seconds_bucket{{{base},le="{le}"}} {count}')
+            lines.append(f"marp_span_seconds_sum{{{base}}} {entry['sum']:.6f}")
+            lines.append(f"marp_span_seconds_count{{{base}}} {entry['count']}")
+
+        for collector in self.collectors:
+            try:
+                gauges = collector()
+            except Exception as e:
+                log("Metrics", f"Collector failed: {e}")
+                continue
+            for name, value in gauges.items():
+                lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Atomically write the metrics for a node_exporter-style textfile collector."""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+
+
+class Span:
+    __slots__ = ("name", "elapsed")
+
+    def __init__(self, name):
+        self.name = name
+        self.elapsed = 0.0
+
+
+@contextmanager
+def span(name: str, **labels):
+    """
+    Time a block: the duration goes into the span histogram, into the per-call
+    trace opened by collect_timings() (if any) and into the debug log.
+    """
+    current = Span(name)
+    started = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.elapsed = time.perf_counter() - started
+        REGISTRY.observe(name, current.elapsed, tuple(sorted(labels.items())))
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((name, current.elapsed))
+        log("Trace", f"{name} {current.elapsed * 1000:.1f} ms")
+
+
+@contextmanager
+def collect_timings():
+    """Collect the (span, seconds) pairs recorded inside the block, tasks it spawns included."""
+    trace = []
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def _duration(seconds):
+    return f"{seconds:.2f} s" if seconds >= 1 else f"{seconds * 1000:.0f} ms"
+
+
+def format_timings(trace):
+    """One-line summary of a trace: top-level spans with their sub-spans in parentheses."""
+    totals = {}
+    for name, seconds in trace:
+        totals[name] = totals.get(name, 0.0) + seconds
+    parts = []
+    for name, seconds in totals.items():
+        if "." in name:
+            continue
+        children = [
+            f"{child.split('.', 1)[1]} {_duration(child_seconds)}"
+            for child, child_seconds in totals.items() if child.startswith(name + ".")
+        ]
+        parts.append(f"{name} {_duration(seconds)}" + (f" ({', '.join(children)})" if children else ""))
+    return ", ".join(parts)
@@ -0,0 +1,135 @@
+import re
+
+HEADING_LINE_RE = re.compile(r' {0,3}#{1,6}(?:\s|$)')
+RULE_LINE_RE = re.compile(r'\s*---\s*$')
+INLINE_MATH_RE = re.compile(r'\\\((.*?)\\\)')
+DISPLAY_MATH_RE = re.compile(r'\\\[(.*?)\\\]')
+
+
+def _stripped_bounds(content, start, end):
+    while start < end and content[start].isspace():
+        start += 1
+    while end > start and content[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _iter_lines(content, start, end):
+    """Lines of content[start:end], sliced one at a time instead of split() up front."""
+    while start <= end:
+        newline = content.find("\n", start, end)
+        if newline == -1:
+            yield content[start:end]
+            return
+        yield content[start:newline]
+        start = newline + 1
+
+
+def _rewrite(lines, previous="", in_math=False):
+    """
+    Per line: drop manual `---` breaks, put a blank line before headings and turn
+    \\( \\) / \\[ \\] math into $ / $$. Fenced code is passed through untouched and
+    display math is only scanned for its closing delimiter. Yields (line, verbatim).
+    """
+    in_code = False
+    # An open \[ only becomes $$ once its \] shows up, so the lines in between wait here.
+    bracket = None
+    for line in lines:
+        if bracket is not None:
+            close = line.find("\\]")
+            if close == -1:
+                bracket[2].append(line)
+                continue
+            yield bracket[0], False
+            for held in bracket[2]:
+                yield held, False
+            line = line[:close] + "$$" + INLINE_MATH_RE.sub(r"$\1$", line[close + 2:])
+            bracket = None
+            previous = line
+            yield line, False
+            continue
+        if line.strip().startswith("```"):
+            in_code = not in_code
+            previous = line
+            yield line, True
+            continue
+        if in_code:
+            previous = line
+            yield line, True
+            continue
+        if in_math:
+            if line.count("$$") % 2:
+                in_math = False
+            previous = line
+            yield line, False
+            continue
+
+        if "---" in line and RULE_LINE_RE.match(line):
+            # None marks a dropped break; its whole blank run collapses to one empty line.
+            previous = ""
+            yield None, False
+            continue
+        if previous and "#" in line[:4] and HEADING_LINE_RE.match(line):
+            yield "", False
+        if "\\" in line:
+            line = INLINE_MATH_RE.sub(r"$\1$", line)
+            line = DISPLAY_MATH_RE.sub(r"$$\1$$", line)
+            opened = line.rfind("\\[")
+            if opened != -1:
+                bracket = (line[:opened] + "$$" + line[opened + 2:], line, [])
+                continue
+        if "$$" in line and line.count("$$") % 2:
+            in_math = True
+        previous = line
+        yield line, False
+
+    if bracket is not None:
+        # Never closed: leave the \[ as it is and treat what followed as ordinary lines.
+        yield bracket[1], False
+        yield from _rewrite(bracket[2], bracket[1], bracket[1].count("$$") % 2 == 1)
+
+
+def _collapse_blank_lines(rewritten):
+    """Collapse runs of empty lines outside code and drop blank lines at both ends."""
+    pending = []
+    dropped_break = False
+    held = None
+    for line, verbatim in rewritten:
+        if line is None:
+            dropped_break = True
+            continue
+        if not line.strip():
+            if held is None and not verbatim:
+                continue
+            if not line and pending and not pending[-1] and not verbatim:
+                continue
+            pending.append(line)
+            continue
+        if held is not None:
+            yield held
+            yield from [""] if dropped_break else pending
+        elif line[:1].isspace():
+            line = line.lstrip()
+        pending = []
+        dropped_break = False
+        held = line
+    if held is not None:
+        yield held.rstrip()
+
+
+def normalize_lines(content, auto_split=True):
+    """
+    Strip front matter and, unless the deck keeps its own page breaks, flatten it
+    for the splitter in a single streaming pass over its lines. Returns
+    (lines, needs_split) where `lines` is an iterator of output lines.
+    """
+    start, end = _stripped_bounds(content, 0, len(content))
+    if content.startswith("---", start):
+        close = content.find("---", start + 3, end)
+        if close != -1:
+            start, end = _stripped_bounds(content, close + 3, end)
+
+    has_manual_breaks = content.find("\n---", start, end) != -1
+    if auto_split or not has_manual_breaks:
+        return _collapse_blank_lines(_rewrite(_iter_lines(content, start, end))), True
+    return _iter_lines(content, start, end), False
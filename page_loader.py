@@ -0,0 +1,92 @@
+import os
+import re
+import uuid
+import pathlib
+from urllib.parse import urlsplit, unquote
+from urllib.request import url2pathname
+
+# Documents are served from this origin instead of file://, straight from memory.
+VIRTUAL_ORIGIN = "http://marp.localhost"
+
+# An http page may not load file:// resources, so those its markup and CSS load move
+# onto the origin. Only tags and <style> blocks are touched: slide text stays as written.
+FILE_URL = r'file://(?:localhost)?(?=/)'
+MARKUP_RE = re.compile(r'<style\b[^>]*>.*?</style\s*>|<([a-zA-Z][\w:-]*)[^>]*>', re.IGNORECASE | re.DOTALL)
+ATTR_RE = re.compile(
+    r'(\s(src|srcset|poster|xlink:href|href|style)\s*=\s*)("[^"]*"|\'[^\']*\'|[^\s"\'>]+)', re.IGNORECASE
+)
+VALUE_URL_RE = re.compile(r'^(["\']?)' + FILE_URL, re.IGNORECASE)
+SRCSET_URL_RE = re.compile(r'(^["\']?|,\s*)' + FILE_URL, re.IGNORECASE)
+CSS_URL_RE = re.compile(r'(url\(\s*(?:["\']|&quot;)?)' + FILE_URL, re.IGNORECASE)
+# Elements whose href loads a resource; <a> links keep their file:// targets.
+LOADING_HREF_TAGS = ("link", "image", "use")
+
+
+def virtual_url(local_path: str):
+    """Map a local path onto the virtual origin, keeping the file:// path layout."""
+    return VIRTUAL_ORIGIN + pathlib.Path(os.path.abspath(local_path)).as_uri()[len("file://"):]
+
+
+def _rewrite_attr(match, tag_name):
+    name = match.group(2).lower()
+    if name == "style":
+        value = CSS_URL_RE.sub(r"\1" + VIRTUAL_ORIGIN, match.group(3))
+    elif name == "srcset":
+        value = SRCSET_URL_RE.sub(r"\1" + VIRTUAL_ORIGIN, match.group(3))
+    elif name == "href" and tag_name not in LOADING_HREF_TAGS:
+        return match.group(0)
+    else:
+        value = VALUE_URL_RE.sub(r"\1" + VIRTUAL_ORIGIN, match.group(3))
+    return match.group(1) + value
+
+
+def _rewrite_markup(match):
+    if match.group(1) is None:
+        return CSS_URL_RE.sub(r"\1" + VIRTUAL_ORIGIN, match.group(0))
+    tag_name = match.group(1).lower()
+    return ATTR_RE.sub(lambda attr: _rewrite_attr(attr, tag_name), match.group(0))
+
+
+def serve_file_urls(html: str):
+    """Move the file:// URLs that tags and stylesheets of `html` load onto the virtual origin."""
+    if "file:" not in html.lower():
+        return html
+    return MARKUP_RE.sub(_rewrite_markup, html)
+
+
+def _local_path(url: str):
+    return url2pathname(unquote(urlsplit(url).path))
+
+
+async def load_html(page, html: str, base_dir: str, substitutes=None):
+    """
+    Navigate `page` to an in-memory HTML document without writing it to disk.
+
+    The document is served through a request route as if it lived in `base_dir`,
+    so relative image, font and stylesheet URLs resolve exactly like they would
+    for a file:// page there: every other request on the virtual origin is
+    answered from the matching local file. Each call uses a unique document URL,
+    so concurrent loads never see each other's content. file:// URLs of images,
+    media and stylesheets are rewritten onto the virtual origin, where they map
+    to the same local file (see serve_file_urls); links and slide text keep
+    theirs. `substitutes` maps local paths to route.fulfill() arguments served
+    in their place (placeholder or downscaled images).
+    """
+    html = serve_file_urls(html)
+    document_url = virtual_url(os.path.join(base_dir, f".marp-{uuid.uuid4().hex}.html"))
+
+    async def serve(route):
+        url = route.request.url
+        if url.split("#", 1)[0] == document_url:
+            await route.fulfill(status=200, content_type="text/html; charset=utf-8", body=html)
+            return
+        local_file = _local_path(url)
+        if substitutes and local_file in substitutes:
+            await route.fulfill(**substitutes[local_file])
+        elif os.path.isfile(local_file):
+            await route.fulfill(path=local_file)
+        else:
+            await route.fulfill(status=404, body="")
+
+    await page.route(f"{VIRTUAL_ORIGIN}/**", serve)
+    await page.goto(document_url)
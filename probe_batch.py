@@ -0,0 +1,151 @@
+import os
+import re
+import time
+import asyncio
+import contextvars
+from deadline import REQUEST_TIMEOUT, PhaseError, remaining
+from engine import FUSED_MEASURE_JS, MEASURE_JS, PROBE_SEGMENT_CHUNKS
+from marp_renderer import build_html_document
+from page_loader import load_html
+from readiness import wait_for_render_ready
+from metrics import log, span
+
+# Chromium ignores @font-face inside shadow roots, so font rules move to the document.
+FONT_RULE_RE = re.compile(r'@import\s[^;]*;|@font-face\s*\{[^}]*\}')
+# marp-core's browser script; it defines the auto-scaling custom elements for the whole document.
+SCRIPT_RE = re.compile(r'<script\b[^>]*>.*?</script>', re.DOTALL)
+
+
+def fused_document(rendered_decks):
+    """
+    One probe document holding several rendered decks. Each deck sits in the
+    declarative shadow root of its own [data-marp-deck] host together with its
+    own CSS, so themes and probe styles cannot leak between decks; only the font
+    rules are hoisted to the document, where every shadow root can use them, and
+    marp-core's browser script runs once after all hosts.
+    """
+    fonts = []
+    hosts = []
+    scripts = []
+    for n, rendered in enumerate(rendered_decks):
+        fonts.extend(FONT_RULE_RE.findall(rendered["css"]))
+        css = FONT_RULE_RE.sub("", rendered["css"])
+        scripts.extend(SCRIPT_RE.findall(rendered["html"]))
+        html = SCRIPT_RE.sub("", rendered["html"])
+        hosts.append(
+            f'<div data-marp-deck="{n}"><template shadowrootmode="open">'
+            f"<style>{css}</style>{html}</template></div>"
+        )
+    # @import rules must open the stylesheet.
+    fonts.sort(key=lambda rule: not rule.startswith("@import"))
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"UTF-8\">"
+        f"<style>{''.join(dict.fromkeys(fonts))}</style><style>body {{ margin: 0; }}</style>"
+        f"</head><body>{''.join(hosts)}{''.join(dict.fromkeys(scripts))}</body></html>"
+    )
+
+
+class ProbeBatcher:
+    """
+    Measures probe documents of concurrent decks together.
+
+    measure() queues one deck's rendered probe document; queued probes
+    are flushed into a single page (see fused_document) when `window_ms` has
+    passed since the first of them or once they hold `max_chunks` probes, and
+    one evaluate call returns every deck's probe positions. Offsets are taken
+    per section, so each deck gets exactly the result it would get on a page of
+    its own; a flush with a single probe uses the plain document. The shared
+    page is given until the latest deadline among its callers, so a wedged page
+    fails the batch and returns its lease instead of holding it forever.
+    """
+
+    def __init__(self, browser_pool, window_ms=10, max_chunks=PROBE_SEGMENT_CHUNKS):
+        self.browser_pool = browser_pool
+        self.window = window_ms / 1000
+        self.max_chunks = max_chunks
+        self.pages = 0
+        self.probes = 0
+        self._pending = []
+        self._size = 0
+        self._timer = None
+        self._tasks = set()
+
+    @classmethod
+    def from_env(cls, browser_pool):
+        """None unless MARP_PROBE_FUSION=1, so by default every probe gets a page of its own."""
+        if os.environ.get("MARP_PROBE_FUSION", "0") != "1":
+            return None
+        return cls(browser_pool, window_ms=float(os.environ.get("MARP_PROBE_FUSION_WINDOW_MS", "10")))
+
+    async def measure(self, rendered, substitutes=None):
+        """
+        Measure one render() result of a probe document, serving `substitutes` like
+        load_html(); returns (result, readiness) as a page of its own would.
+        """
+        size = rendered["html"].count('class="m-probe"')
+        future = asyncio.get_running_loop().create_future()
+        left = remaining()
+        deadline = time.monotonic() + (REQUEST_TIMEOUT if left is None else left)
+        if self._pending and self._size + size > self.max_chunks:
+            self._flush()
+        self._pending.append((rendered, substitutes, future, deadline))
+        self._size += size
+        if self._size >= self.max_chunks:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        # Shielded: a caller that gives up must not cancel the other decks' measurement.
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._size = self._pending, [], 0
+        if batch:
+            # A fresh context, so no single caller's request deadline bounds the shared page.
+            task = asyncio.create_task(self._run(batch), context=contextvars.Context())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        try:
+            substitutes = {}
+            for _, deck_substitutes, _, _ in batch:
+                substitutes.update(deck_substitutes or {})
+            output_dir = os.path.join(os.path.abspath(os.getcwd()), "output_slides")
+            if len(batch) == 1:
+                html_doc, script = build_html_document(batch[0][0]), MEASURE_JS
+            else:
+                html_doc, script = fused_document([rendered for rendered, _, _, _ in batch]), FUSED_MEASURE_JS
+            timeout = max(deadline for _, _, _, deadline in batch) - time.monotonic()
+            with span("split.fused_probe"):
+                try:
+                    readiness, results = await asyncio.wait_for(
+                        self._evaluate(html_doc, script, output_dir, substitutes), timeout=max(timeout, 0)
+                    )
+                except asyncio.TimeoutError:
+                    raise PhaseError("split.measure", f"shared probe page timed out after {timeout:.3g} s",
+                                     timed_out=True) from None
+            self.pages += 1
+            self.probes += len(batch)
+            if len(batch) > 1:
+                log("ProbeBatch", f"Measured {len(batch)} probe documents on one page")
+            for n, (_, _, future, _) in enumerate(batch):
+                if not future.done():
+                    future.set_result((results[str(n)] if len(batch) > 1 else results, readiness))
+        except BaseException as e:
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+
+    async def _evaluate(self, html_doc, script, output_dir, substitutes):
+        async with self.browser_pool.lease() as page:
+            await load_html(page, html_doc, output_dir, substitutes or None)
+            readiness = await wait_for_render_ready(page)
+            return readiness, await page.evaluate(script)
+
+    def stats(self):
+        return {"pages": self.pages, "probes": self.probes}
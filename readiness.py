@@ -0,0 +1,78 @@
+import os
+from metrics import inc, log
+
+DEFAULT_READY_TIMEOUT_MS = int(os.environ.get("MARP_READY_TIMEOUT_MS", "5000"))
+
+# Resolves once fonts, images and math are settled and the layout has not
+# moved across two consecutive animation frames, or when the hard bound hits.
+READY_JS = """
+async (timeoutMs) => {
+    const start = performance.now();
+    const signals = {};
+    const elapsed = () => performance.now() - start;
+    const settle = (name, promise) => Promise.resolve(promise).then(
+        () => { signals[name] = elapsed(); },
+        () => { signals[name] = elapsed(); }
+    );
+    const nextFrame = () => new Promise(resolve => requestAnimationFrame(() => resolve()));
+    // Fused probes keep each deck in the shadow root of a [data-marp-deck] host.
+    const roots = [document, ...Array.from(document.querySelectorAll('[data-marp-deck]'), host => host.shadowRoot).filter(Boolean)];
+    const all = selector => roots.flatMap(root => Array.from(root.querySelectorAll(selector)));
+    const layoutSignature = () => {
+        const parts = [document.documentElement.scrollHeight];
+        all('section').forEach(s => parts.push(s.offsetHeight));
+        return parts.join(',');
+    };
+
+    const pending = [];
+    if (document.fonts && document.fonts.status !== 'loaded') {
+        pending.push(settle('fonts', document.fonts.ready));
+    }
+    const images = all('img');
+    if (images.length) {
+        pending.push(settle('images', Promise.all(images.map(img => img.decode().catch(() => null)))));
+    }
+    if (window.MathJax && window.MathJax.startup && window.MathJax.startup.promise) {
+        pending.push(settle('math', window.MathJax.startup.promise));
+    }
+
+    const ready = (async () => {
+        await Promise.all(pending);
+        let previous = layoutSignature();
+        while (true) {
+            await nextFrame();
+            await nextFrame();
+            const current = layoutSignature();
+            if (current === previous) break;
+            previous = current;
+        }
+        signals.layout = elapsed();
+        return false;
+    })();
+    const timeout = new Promise(resolve => setTimeout(() => resolve(true), timeoutMs));
+    const timedOut = await Promise.race([ready, timeout]);
+
+    let waitedOn = 'layout';
+    let slowest = -1;
+    for (const [name, ms] of Object.entries(signals)) {
+        if (ms > slowest) { slowest = ms; waitedOn = name; }
+    }
+    return { waitedOn: timedOut ? 'timeout' : waitedOn, signals: signals, elapsedMs: elapsed(), timedOut: timedOut };
+}
+"""
+
+
+async def wait_for_render_ready(page, timeout_ms=DEFAULT_READY_TIMEOUT_MS):
+    """
+    Wait until the probe page is safe to measure and report what it waited on.
+
+    Replaces a fixed sleep: trivial decks return after two animation frames,
+    while decks with web fonts, images or MathJax wait for those signals, up
+    to `timeout_ms`. The returned dict holds `waitedOn` (the slowest signal,
+    or "timeout"), per-signal `signals` timings in ms, `elapsedMs` and `timedOut`.
+    """
+    report = await page.evaluate(READY_JS, timeout_ms)
+    if report.get("timedOut"):
+        inc("marp_readiness_timeouts_total")
+        log("Readiness", f"Hit the {timeout_ms} ms bound, measuring anyway")
+    return report
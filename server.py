@@ -1,12 +1,191 @@
 import os
 import sys
+import json
+import time
 import shutil
 import asyncio
-import re
-from mcp.server.fastmcp import FastMCP
+from types import MappingProxyType
+from typing import NamedTuple
+from contextlib import asynccontextmanager
+from mcp.server.fastmcp import FastMCP, Context
 from engine import EngineSplitter  
+from probe_batch import ProbeBatcher
+from browser_pool import BrowserPool
+from marp_renderer import MarpRenderer
+from measure_cache import HeightCache, available_themes, theme_fingerprint
+from artifact_store import ArtifactStore, artifact_key
+from assets import ImageAssets, content_key
+from layout_estimator import CalibrationStore
+from exporter import export_presentation, png_paths
+from normalizer import normalize_lines
+from jobs import JobManager, TERMINAL_STATES
+from deadline import PhaseError, REQUEST_TIMEOUT, request_deadline
+from metrics import REGISTRY, collect_timings, format_timings, inc, log, span
 
-mcp = FastMCP("Marp-fast PPT maker-Agent")
+# Server-scoped Chromium pool and Marp worker, created on first use and closed on shutdown.
+browser_pool = None
+marp_renderer = None
+job_manager = None
+probe_batcher = None
+height_cache = HeightCache.from_env()
+layout_calibrations = CalibrationStore.from_env()
+artifact_store = ArtifactStore.from_env(os.path.abspath(os.getcwd()))
+image_assets = ImageAssets.from_env(os.path.abspath(os.getcwd()))
+
+# Stage limits shared by every call, so concurrent decks cannot oversubscribe the
+# browsers or the Marp worker; batches run at most MARP_BATCH_WORKERS decks at once.
+probe_slots = asyncio.Semaphore(max(1, int(os.environ.get("MARP_PROBE_CONCURRENCY", "4"))))
+export_slots = asyncio.Semaphore(max(1, int(os.environ.get("MARP_EXPORT_CONCURRENCY", "2"))))
+BATCH_WORKERS = max(1, int(os.environ.get("MARP_BATCH_WORKERS", str(os.cpu_count() or 4))))
+
+# Optional Prometheus textfile, rewritten after every deck.
+METRICS_FILE = os.environ.get("MARP_METRICS_FILE") or None
+
+# Start-up warmup: resolve the toolchain, start the Marp worker and the browsers and
+# hash the themes before the first request; optionally measure a small deck per theme.
+WARMUP = os.environ.get("MARP_WARMUP", "1") != "0"
+WARMUP_THEMES = os.environ.get("MARP_WARMUP_THEMES", "0") == "1"
+WARMUP_DECK = "# Warmup\n\nA short paragraph.\n\n- one\n- two\n\n| a | b |\n|---|---|\n| 1 | 2 |\n"
+
+
+class RuntimeConfig(NamedTuple):
+    """The resolved toolchain, built once per process and replaced rather than modified."""
+    marp_bin: str
+    browser_path: str
+    env: MappingProxyType
+    marp_version: str = None
+    browser_version: str = None
+    themes: tuple = ()
+
+
+runtime = None
+
+def get_browser_pool(browser_path):
+    global browser_pool
+    if browser_pool is None:
+        browser_pool = BrowserPool.from_env(executable_path=browser_path)
+    return browser_pool
+
+def get_probe_batcher(browser_path):
+    """Shared batcher that measures concurrent decks' probes on one page, or None if disabled."""
+    global probe_batcher
+    if probe_batcher is None:
+        probe_batcher = ProbeBatcher.from_env(get_browser_pool(browser_path))
+    return probe_batcher
+
+def get_job_manager():
+    global job_manager
+    if job_manager is None:
+        job_manager = JobManager.from_env(run_job, os.path.abspath(os.getcwd()))
+    return job_manager
+
+def get_marp_renderer(env):
+    """The persistent Marp worker, or None to fall back to the marp CLI."""
+    global marp_renderer
+    if marp_renderer is None:
+        marp_renderer = MarpRenderer.discover(os.path.abspath(os.getcwd()), env=env)
+    return marp_renderer
+
+def runtime_gauges():
+    gauges = {}
+    if browser_pool is not None:
+        for key, value in browser_pool.stats().items():
+            gauges[f"marp_browser_pool_{key}"] = value
+    if marp_renderer is not None:
+        gauges["marp_worker_requests"] = marp_renderer.requests
+        gauges["marp_worker_restarts"] = marp_renderer.restarts
+    if probe_batcher is not None:
+        gauges["marp_fused_probe_pages"] = probe_batcher.pages
+        gauges["marp_fused_probe_documents"] = probe_batcher.probes
+    gauges["marp_height_cache_entries"] = height_cache.stats()["entries"]
+    if artifact_store is not None:
+        store = artifact_store.stats()
+        gauges["marp_artifact_store_entries"] = store["entries"]
+        gauges["marp_artifact_store_bytes"] = store["bytes"]
+    return gauges
+
+REGISTRY.add_collector(runtime_gauges)
+
+async def _tool_version(command, env):
+    """First line of `command --version`, or None if it does not run."""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            command, "--version", stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+            stdin=asyncio.subprocess.DEVNULL, env=env
+        )
+    except OSError:
+        return None
+    try:
+        out, _ = await asyncio.wait_for(proc.communicate(), timeout=60)
+    except asyncio.TimeoutError:
+        proc.kill()
+        return None
+    lines = out.decode("utf-8", errors="replace").strip().splitlines()
+    return lines[0] if proc.returncode == 0 and lines else None
+
+
+async def warm_up():
+    """Resolve and validate the toolchain, start the Marp worker and browsers and hash the themes."""
+    global runtime
+    with span("warmup"):
+        marp_bin, env, error = prepare_toolchain()
+        if error:
+            log("Warmup", f"Skipped: {error}")
+            return
+        base_dir = os.path.abspath(os.getcwd())
+        themes_dir = os.path.join(base_dir, "themes")
+        builtin, local = available_themes(themes_dir)
+        themes = tuple((name, theme_fingerprint(name, themes_dir)) for name in builtin + local)
+
+        marp_version = await _tool_version(marp_bin, env)
+        if marp_version is None:
+            log("Warmup", f"{marp_bin} --version failed; the CLI fallback may not work")
+        renderer = get_marp_renderer(env)
+        if renderer is not None:
+            await renderer.start()
+        browser_version = await get_browser_pool(env["CHROME_PATH"]).warm()
+        runtime = runtime._replace(marp_version=marp_version, browser_version=browser_version, themes=themes)
+        log("Warmup", f"Marp: {marp_version}, browser: {browser_version}, {len(themes)} theme(s)")
+
+        if WARMUP_THEMES:
+            # Measuring a small deck per theme also calibrates the layout estimator for it.
+            for name, _ in themes:
+                splitter = EngineSplitter(slide_usable_height=620)
+                async with probe_slots:
+                    await splitter.process(
+                        WARMUP_DECK, name, marp_bin, env, 2,
+                        browser_pool=get_browser_pool(env["CHROME_PATH"]), renderer=renderer,
+                        height_cache=height_cache, calibrations=layout_calibrations
+                    )
+
+
+async def _warm_up_quietly():
+    try:
+        await warm_up()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        log("Warmup", f"Failed, continuing with lazy start-up: {e}")
+
+
+@asynccontextmanager
+async def server_lifespan(server):
+    warmup = asyncio.create_task(_warm_up_quietly()) if WARMUP else None
+    try:
+        yield
+    finally:
+        if warmup is not None:
+            warmup.cancel()
+            await asyncio.gather(warmup, return_exceptions=True)
+        if job_manager is not None:
+            await job_manager.close()
+        if browser_pool is not None:
+            await browser_pool.close()
+        if marp_renderer is not None:
+            await marp_renderer.close()
+        height_cache.close()
+
+mcp = FastMCP("Marp-fast PPT maker-Agent", lifespan=server_lifespan)
 
 def find_browser_path():
     """Cross-platform browser path detection."""
@@ -52,7 +231,9 @@ async def create_presentation(
     style_class: str = "",
     auto_split: bool = True,
     generate_pptx: bool = True,
-    heading_split_levels: int = 2
+    heading_split_levels: int = 2,
+    generate_png: bool = False,
+    include_timings: bool = False
 ) -> str:
     """
     One-click tool to convert Markdown into PPT-style slides. It auto-splits content and
@@ -62,6 +243,8 @@ async def create_presentation(
 
     Parameters:
     - generate_pptx: Whether to generate the PPTX file. Default is True.
+    - generate_png: Whether to also export every slide as a PNG image. Default is False.
+    - include_timings: Append a per-phase timing summary to the result. Default is False.
 
     [LLM Theme Guide] Choose the best theme based on the content:
     - "default": Small font, clean black-on-white, best compatibility.
@@ -87,42 +270,338 @@ async def create_presentation(
     - 1: Only the top-level headings (e.g., H1) trigger page breaks.
     - 3 or more: For very deep documents where each subsection is long.
     """
-    marp_bin = find_marp_executable()
-    if not marp_bin:
-        return "❌ Error: Marp not found."
-    browser_path = find_browser_path()
-    if not browser_path:
-        return "❌ Error: Browser not found."
-
-    env = os.environ.copy()
-    env["CHROME_PATH"] = browser_path
-    if sys.platform != "win32":
-        env["PATH"] = "/usr/local/bin:/opt/homebrew/bin:" + env.get("PATH", "")
-
-    final_content = content.strip()
-    
-    if final_content.startswith('---'):
-        parts = final_content.split('---', 2)
-        if len(parts) >= 3:
-            final_content = parts[2].strip()
+    marp_bin, env, error = prepare_toolchain()
+    if error:
+        return error
+    with collect_timings() as trace, request_deadline():
+        try:
+            lines, _, _ = await build_presentation(
+                title, content, marp_bin, env, theme, style_class, auto_split,
+                generate_pptx, heading_split_levels, generate_png
+            )
+        except PhaseError as e:
+            inc("marp_decks_total", status="failed")
+            log("Server", f"Deck '{title}' failed: {e}")
+            lines = [f"❌ Error: {e}"]
+    if include_timings:
+        lines.append(f"⏱️ Timings: {format_timings(trace)}")
+    return "\n".join(lines)
 
-    has_manual_breaks = "\n---" in final_content
-    
-    if auto_split or not has_manual_breaks:
-        final_content = re.sub(r'^\s*---\s*$', '', final_content, flags=re.MULTILINE)
-        final_content = re.sub(r'([^\n])\n( {0,3}#{1,6}\s)', r'\1\n\n\2', final_content)
-        final_content = re.sub(r'\\\((.*?)\\\)', r'$\1$', final_content)
-        final_content = re.sub(r'\\\[(.*?)\\\]', r'$$\1$$', final_content, flags=re.DOTALL)
-        final_content = re.sub(r'\n{3,}', '\n\n', final_content).strip()
-        
-        splitter = EngineSplitter(slide_usable_height=620)
-        final_content = await splitter.process(final_content, theme, marp_bin, env, heading_split_levels)
 
-    header = f"---\nmarp: true\ntheme: {theme}\nclass: {style_class}\npaginate: true\n---\n\n"
-    full_markdown = header + final_content
+@mcp.tool()
+async def plan_layout(
+    content: str,
+    theme: str = "default",
+    heading_split_levels: int = 2,
+    as_json: bool = False
+) -> str:
+    """
+    Preview how `content` will paginate without exporting anything: runs only the
+    chunking and measurement of `create_presentation` (reusing its height cache),
+    so content can be revised and re-planned cheaply before the one real export.
+
+    For every slide it reports the chunk range, the measured content height
+    against the safe usable height and the fill ratio, why the slide starts
+    there ("heading" for a split heading, "overflow" when the previous slide
+    was full) and the table header or parent list items repeated on it.
+    Theme and heading_split_levels mean the same as in `create_presentation`.
+    With `as_json`, the plan is returned as a JSON list of slide objects.
+    """
+    marp_bin, env, error = prepare_toolchain()
+    if error:
+        return error
+    lines, _ = normalize_lines(content)
+    browser_path = env["CHROME_PATH"]
+    output_dir = os.path.join(os.path.abspath(os.getcwd()), "output_slides")
+    images = image_assets.scan(content, output_dir) if image_assets is not None else {}
+    with request_deadline():
+        try:
+            async with probe_slots:
+                with span("plan"):
+                    splitter = EngineSplitter(slide_usable_height=620, probe_batcher=get_probe_batcher(browser_path))
+                    slides = await splitter.plan(
+                        lines, theme, marp_bin, env, heading_split_levels,
+                        browser_pool=get_browser_pool(browser_path), renderer=get_marp_renderer(env),
+                        height_cache=height_cache, calibrations=layout_calibrations, images=images
+                    )
+        except PhaseError as e:
+            log("Server", f"Layout plan failed: {e}")
+            return f"❌ Error: {e}"
+    publish_metrics()
+
+    if as_json:
+        return json.dumps(slides, ensure_ascii=False)
+    out = [f"📐 Layout plan: {len(slides)} slides ({theme})"]
+    for number, slide in enumerate(slides, 1):
+        line = (
+            f"[{number}] chunks {slide['start']}-{slide['end'] - 1}: "
+            f"{slide['height']:.0f}/{slide['safe_usable_height']:.0f} px ({slide['fill_ratio']:.0%}), "
+            f"{slide['split_reason']}"
+        )
+        if slide["split_reason"] == "heading":
+            line += f" (h{slide['heading_level']})"
+        if slide["fill_ratio"] > 1:
+            line += " ⚠️ overflows"
+        if slide["carried_header"]:
+            line += ", repeats table header"
+        if slide["carried_context"]:
+            line += f", repeats {len(slide['carried_context'])} list item(s)"
+        out.append(line)
+        out.append(f"    {slide['first_line']}")
+    return "\n".join(out)
+
+
+@mcp.tool()
+async def create_presentations_batch(decks: list[dict], max_workers: int = 0) -> str:
+    """
+    Generate many decks in one call. Each entry of `decks` is a deck spec with the
+    same fields as `create_presentation`: "title" and "content" are required;
+    "theme", "style_class", "auto_split", "generate_pptx", "heading_split_levels"
+    and "generate_png" are optional and use the same defaults.
+
+    Decks are scheduled over a bounded pool of `max_workers` workers (0 = one per
+    CPU core) that share the warm browsers and the Marp worker; the measurement
+    and export stages have their own concurrency limits. Returns the outcome and
+    timings of every deck, in input order. Titles must be unique within a batch.
+    """
+    marp_bin, env, error = prepare_toolchain()
+    if error:
+        return error
+    if not decks:
+        return "❌ Error: No decks given."
+
+    workers = min(len(decks), max_workers if max_workers > 0 else BATCH_WORKERS)
+    reports = [None] * len(decks)
+    seen_titles = set()
+    queue = asyncio.Queue()
+    for index, spec in enumerate(decks):
+        problem = _check_deck_spec(spec, seen_titles)
+        if problem:
+            reports[index] = ([f"❌ Error: {problem}"], None, None)
+        else:
+            queue.put_nowait(index)
+
+    async def worker():
+        while not queue.empty():
+            index = queue.get_nowait()
+            spec = decks[index]
+            options = {key: spec[key] for key in DECK_OPTIONS if key in spec}
+            try:
+                # Every deck gets the full request deadline, counted from when a worker picks it up.
+                with request_deadline():
+                    reports[index] = await build_presentation(spec["title"], spec["content"], marp_bin, env, **options)
+            except Exception as e:
+                inc("marp_decks_total", status="failed")
+                log("Batch", f"Deck '{spec['title']}' failed: {e}")
+                reports[index] = ([f"❌ Error: {e}"], None, None)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    elapsed = time.perf_counter() - started
+
+    succeeded = sum(1 for lines, _, _ in reports if not any(line.startswith("❌") for line in lines))
+    out = [f"📦 Batch: {succeeded}/{len(decks)} decks succeeded in {elapsed:.1f} s ({workers} workers)"]
+    for index, (lines, timings, _) in enumerate(reports):
+        title = decks[index].get("title") if isinstance(decks[index], dict) else None
+        heading = f"[{index + 1}] {title or '(untitled)'}"
+        if timings:
+            heading += (
+                f" - {timings['total']:.1f} s (split {timings['split']:.1f} s, export {timings['export']:.1f} s,"
+                f" queued {timings['queued']:.1f} s)"
+            )
+        out.append("")
+        out.append(heading)
+        out.extend(lines)
+    return "\n".join(out)
+
+
+@mcp.tool()
+async def submit_presentation(
+    title: str,
+    content: str,
+    ctx: Context,
+    theme: str = "default",
+    style_class: str = "",
+    auto_split: bool = True,
+    generate_pptx: bool = True,
+    heading_split_levels: int = 2,
+    generate_png: bool = False
+) -> str:
+    """
+    Queue a deck build and return a job ID immediately; parameters are the same as
+    `create_presentation`. Use this for long decks instead of waiting on the build:
+    poll `get_presentation_status`, then fetch the outputs with
+    `get_presentation_result`. Phase changes are also sent as log notifications.
+    """
+    _, _, error = prepare_toolchain()
+    if error:
+        return error
+    params = {
+        "title": title, "content": content, "theme": theme, "style_class": style_class,
+        "auto_split": auto_split, "generate_pptx": generate_pptx,
+        "heading_split_levels": heading_split_levels, "generate_png": generate_png,
+    }
+    session = ctx.session
 
+    async def notify(job):
+        await session.send_log_message(
+            level="info", logger="marp-jobs",
+            data={"job_id": job["id"], "status": job["status"], "phase": job["phase"], "percent": job["percent"]},
+        )
+
+    manager = get_job_manager()
+    job = await manager.submit(params, listener=notify)
+    return f"🆔 Job {job['id']} queued (position {manager.position(job['id'])}) for '{title}'."
+
+
+def _job_status_line(job):
+    line = f"Job {job['id']} ('{job['params']['title']}'): {job['status']}"
+    if job["status"] == "queued":
+        line += f", position {get_job_manager().position(job['id'])} in queue"
+    elif job["status"] == "running":
+        line += f" - {job['phase']} ({job['percent']}%)"
+    return line
+
+
+@mcp.tool()
+async def get_presentation_status(job_id: str) -> str:
+    """Report a submitted job's state, current phase and percent complete, and its artifacts once finished."""
+    manager = get_job_manager()
+    await manager.start()
+    job = manager.get(job_id)
+    if job is None:
+        return f"❌ Error: Unknown job '{job_id}'."
+    lines = [_job_status_line(job)]
+    for fmt, detail in job["artifacts"].items():
+        lines.append(f"- {fmt}: {detail if isinstance(detail, str) else f'{len(detail)} images'}")
+    error = job["error"]
+    if isinstance(error, dict):
+        lines.append(f"- error in {error['phase']}: {error['message']}" + (" (timed out)" if error["timedOut"] else ""))
+    return "\n".join(lines)
+
+
+@mcp.tool()
+async def get_presentation_result(job_id: str, ctx: Context, wait_seconds: float = 0) -> str:
+    """
+    Return a finished job's outputs (the same lines `create_presentation` returns).
+    With `wait_seconds` > 0, wait up to that long for the job to finish, sending
+    progress notifications as its phases complete.
+    """
+    manager = get_job_manager()
+    await manager.start()
+    job = manager.get(job_id)
+    if job is None:
+        return f"❌ Error: Unknown job '{job_id}'."
+
+    if wait_seconds > 0 and job["status"] not in TERMINAL_STATES:
+        reported = [job["percent"]]
+
+        async def on_update(job):
+            if job["percent"] != reported[-1]:
+                reported.append(job["percent"])
+                await ctx.report_progress(job["percent"], 100, job["phase"])
+        job = await manager.wait(job_id, wait_seconds, on_update)
+
+    if job["status"] not in TERMINAL_STATES:
+        return _job_status_line(job) + " - not finished yet."
+    return "\n".join(job["lines"])
+
+
+async def run_job(params, progress):
+    marp_bin, env, error = prepare_toolchain()
+    if error:
+        return [error], {}
+    options = {key: params[key] for key in DECK_OPTIONS if key in params}
+    with request_deadline():
+        lines, _, artifacts = await build_presentation(
+            params["title"], params["content"], marp_bin, env, progress=progress, **options
+        )
+    return lines, artifacts
+
+
+DECK_OPTIONS = ("theme", "style_class", "auto_split", "generate_pptx", "heading_split_levels", "generate_png")
+
+
+def _check_deck_spec(spec, seen_titles):
+    """Validate one batch entry; returns a problem description or None."""
+    if not isinstance(spec, dict):
+        return "Deck spec must be an object."
+    for key in ("title", "content"):
+        if not isinstance(spec.get(key), str) or not spec[key].strip():
+            return f"Deck spec is missing '{key}'."
+    unknown = set(spec) - {"title", "content", *DECK_OPTIONS}
+    if unknown:
+        return f"Unknown deck option(s): {', '.join(sorted(unknown))}."
+    if spec["title"] in seen_titles:
+        return f"Duplicate title '{spec['title']}' (outputs would overwrite each other)."
+    seen_titles.add(spec["title"])
+    return None
+
+
+def prepare_toolchain():
+    """
+    Locate marp and a browser once per process; returns (marp_bin, env, error_message).
+    `env` is shared and read-only. Failures are not cached, so installing the
+    missing tool does not need a restart.
+    """
+    global runtime
+    if runtime is None:
+        marp_bin = find_marp_executable()
+        if not marp_bin:
+            return None, None, "❌ Error: Marp not found."
+        browser_path = find_browser_path()
+        if not browser_path:
+            return None, None, "❌ Error: Browser not found."
+
+        env = os.environ.copy()
+        env["CHROME_PATH"] = browser_path
+        if sys.platform != "win32":
+            env["PATH"] = "/usr/local/bin:/opt/homebrew/bin:" + env.get("PATH", "")
+        runtime = RuntimeConfig(marp_bin, browser_path, MappingProxyType(env))
+    return runtime.marp_bin, runtime.env, None
+
+
+async def build_presentation(
+    title, content, marp_bin, env, theme="default", style_class="", auto_split=True,
+    generate_pptx=True, heading_split_levels=2, generate_png=False, progress=None
+):
+    """
+    Split, write and export one deck. Returns (result_lines, timings, artifacts):
+    timings holds the seconds spent queued for a stage slot, splitting, exporting
+    and in total; artifacts maps each produced format to its path(s). `progress`,
+    if given, is awaited as progress(phase, percent) when a phase starts.
+    """
+    started = time.perf_counter()
+    queued = 0.0
+    split_time = 0.0
+    browser_path = env["CHROME_PATH"]
     base_dir = os.path.abspath(os.getcwd())
     output_dir = os.path.join(base_dir, "output_slides")
+    with span("normalize"):
+        # When splitting, the normalized lines stream straight into the chunker.
+        lines, needs_split = normalize_lines(content, auto_split)
+        final_content = lines if needs_split else "\n".join(lines)
+    # Image paths resolve against output_dir, where the deck's .md is written.
+    images = image_assets.scan(content, output_dir) if image_assets is not None else {}
+
+    if needs_split:
+        if progress:
+            await progress("splitting", 5)
+        wait_started = time.perf_counter()
+        async with probe_slots:
+            queued += time.perf_counter() - wait_started
+            with span("split") as phase:
+                splitter = EngineSplitter(slide_usable_height=620, probe_batcher=get_probe_batcher(browser_path))
+                final_content = await splitter.process(
+                    final_content, theme, marp_bin, env, heading_split_levels,
+                    browser_pool=get_browser_pool(browser_path), renderer=get_marp_renderer(env),
+                    height_cache=height_cache, calibrations=layout_calibrations, images=images
+                )
+            split_time = phase.elapsed
+
+    header = f"---\nmarp: true\ntheme: {theme}\nclass: {style_class}\npaginate: true\n---\n\n"
+    full_markdown = header + final_content
+
     os.makedirs(output_dir, exist_ok=True)
     
     md_file = os.path.join(output_dir, f"{title}.md")
@@ -132,58 +611,104 @@ async def create_presentation(
     with open(md_file, "w", encoding="utf-8") as f:
         f.write(full_markdown)
 
-    results = []
-    
-    async def run_marp_async(output_path, format_flag):
-        cmd = [marp_bin, md_file, "-o", output_path, "--allow-local-files"]
+    targets = {}
+    if generate_pptx:
+        targets["pptx"] = pptx_file
+    targets["pdf"] = pdf_file
+    if generate_png:
+        targets["png"] = os.path.join(output_dir, f"{title}.png")
 
-        themes_dir = os.path.join(base_dir, "themes")
-        if os.path.exists(themes_dir):
-            cmd.extend(["--theme-set", themes_dir])
+    exports = {}
+
+    def link_stored(fmt, blobs):
+        # Linked right away: storing a later format may evict this blob from the store.
+        paths = png_paths(os.path.splitext(targets[fmt])[0], len(blobs)) if fmt == "png" else [targets[fmt]]
+        artifact_store.materialize(blobs, paths)
+        exports[fmt] = (True, paths if fmt == "png" else paths[0])
 
+    # Formats already exported for this exact deck come from the artifact store.
+    keys = {}
+    if artifact_store is not None:
+        theme_key = theme_fingerprint(theme, os.path.join(base_dir, "themes"))
+        images_key = content_key(images)
+        for fmt in targets:
+            keys[fmt] = artifact_key(full_markdown, theme_key, style_class, fmt, images_key)
+            blobs = artifact_store.lookup(keys[fmt])
+            if blobs is not None:
+                link_stored(fmt, blobs)
+        if exports:
+            log("Artifacts", f"Reusing stored {', '.join(sorted(exports))} for '{title}'")
+
+    export_time = 0.0
+    pending = {fmt: path for fmt, path in targets.items() if fmt not in exports}
+    if pending:
+        if progress:
+            await progress("exporting", 50)
+        scratch_dir = artifact_store.scratch_dir() if artifact_store is not None else None
+        if scratch_dir:
+            pending = {fmt: os.path.join(scratch_dir, os.path.basename(path)) for fmt, path in pending.items()}
         try:
-            proc = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                stdin=asyncio.subprocess.DEVNULL,
-                env=env
-            )
-            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=120)
-            if proc.returncode != 0:
-                return False, stderr.decode()
-            return True, None
-        except asyncio.TimeoutError:
-            return False, "Command timed out"
-        except Exception as e:
-            return False, str(e)
+            wait_started = time.perf_counter()
+            async with export_slots:
+                queued += time.perf_counter() - wait_started
+                with span("export") as phase:
+                    exported = await export_presentation(
+                        md_file, full_markdown, pending, marp_bin, env,
+                        renderer=get_marp_renderer(env), browser_pool=get_browser_pool(browser_path),
+                        images=images, image_assets=image_assets
+                    )
+                export_time = phase.elapsed
+            for fmt, (ok, detail) in exported.items():
+                if ok and scratch_dir:
+                    link_stored(fmt, artifact_store.put(keys[fmt], fmt, detail if fmt == "png" else [detail]))
+                else:
+                    exports[fmt] = (ok, detail)
+        finally:
+            if scratch_dir:
+                shutil.rmtree(scratch_dir, ignore_errors=True)
 
-    if generate_pptx:
-        ok, err = await run_marp_async(pptx_file, "PPTX")
-        results.append(f"✅ PPTX: {pptx_file}" if ok else f"❌ PPTX failed: {err}")
+    results = []
+    if "pptx" in exports:
+        ok, detail = exports["pptx"]
+        results.append(f"✅ PPTX: {detail}" if ok else f"❌ PPTX failed: {detail}")
 
-    ok, err = await run_marp_async(pdf_file, "PDF")
-    results.append(f"✅ PDF:  {pdf_file}" if ok else f"❌ PDF failed: {err}")
+    ok, detail = exports["pdf"]
+    results.append(f"✅ PDF:  {detail}" if ok else f"❌ PDF failed: {detail}")
 
-    return "\n".join(results)
+    if "png" in exports:
+        ok, detail = exports["png"]
+        if ok:
+            results.append(f"✅ PNG:  {os.path.join(output_dir, title)}.NNN.png ({len(detail)} slides)")
+        else:
+            results.append(f"❌ PNG failed: {detail}")
+
+    timings = {
+        "queued": queued,
+        "split": split_time,
+        "export": export_time,
+        "total": time.perf_counter() - started,
+    }
+    artifacts = {"md": md_file}
+    artifacts.update({fmt: detail for fmt, (ok, detail) in exports.items() if ok})
+    inc("marp_decks_total", status="failed" if any(line.startswith("❌") for line in results) else "ok")
+    publish_metrics()
+    return results, timings, artifacts
+
+
+def publish_metrics():
+    if METRICS_FILE:
+        try:
+            REGISTRY.write_textfile(METRICS_FILE)
+        except OSError as e:
+            log("Metrics", f"Could not write {METRICS_FILE}: {e}")
 
 
 @mcp.resource("theme://available")
 def list_available_themes() -> str:
     """Get a list of all available Marp themes in the local themes directory."""
-    import os
-    
-    base_dir = os.path.abspath(os.getcwd())
-    themes_dir = os.path.join(base_dir, "themes")
-    
-    themes = ["default", "gaia", "uncover"]
-    
-    if os.path.exists(themes_dir):
-        for file in os.listdir(themes_dir):
-            if file.endswith(".css"):
-                theme_name = file[:-4]
-                themes.append(f"{theme_name} (Custom local theme)")
-                
+    builtin, local = available_themes(os.path.join(os.path.abspath(os.getcwd()), "themes"))
+    themes = builtin + [f"{name} (Custom local theme)" for name in local]
+
     result = "Available Marp Themes:\n"
     for t in themes:
         result += f"- {t}\n"
@@ -191,6 +716,45 @@ def list_available_themes() -> str:
     return result
 
 
+@mcp.resource("runtime://config")
+def runtime_config() -> str:
+    """The toolchain resolved at start-up: executables, versions and theme hashes."""
+    if runtime is None:
+        _, _, error = prepare_toolchain()
+        if error:
+            return error + "\n"
+    result = (
+        f"Marp: {runtime.marp_bin} ({runtime.marp_version or 'version not checked yet'})\n"
+        f"Browser: {runtime.browser_path} ({runtime.browser_version or 'not started yet'})\n"
+        f"Request deadline: {REQUEST_TIMEOUT:.0f} s\n"
+    )
+    for name, fingerprint in runtime.themes:
+        result += f"- {name}: {fingerprint.split(':', 1)[1][:12]}\n"
+    return result
+
+
+@mcp.resource("metrics://server")
+def server_metrics() -> str:
+    """Counters, phase timing histograms and pool/cache gauges in the Prometheus text format."""
+    return REGISTRY.render()
+
+
+@mcp.resource("artifacts://store")
+def artifact_store_usage() -> str:
+    """Usage, limits and hit rate of the content-addressed artifact store."""
+    if artifact_store is None:
+        return "Artifact store disabled (MARP_ARTIFACT_STORE=0)\n"
+    stats = artifact_store.stats()
+    return (
+        f"Artifact store: {artifact_store.root}\n"
+        f"- Entries: {stats['entries']}\n"
+        f"- Size: {stats['bytes'] / 1048576:.1f} MiB of {stats['max_bytes'] / 1048576:.0f} MiB\n"
+        f"- Max age: {stats['max_age_s']:.0f} s\n"
+        f"- Hits: {stats['hits']}, misses: {stats['misses']} (hit rate {stats['hit_rate']:.0%})\n"
+        f"- Evictions: {stats['evictions']}\n"
+    )
+
+
 @mcp.prompt()
 def academic_report_prompt(topic: str) -> str:
     """Create a structured prompt for generating a professional academic report presentation."""
@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import artifact_store
+from artifact_store import ArtifactStore
+
+
+def _export(store, name, data):
+    path = os.path.join(store.scratch_dir(), name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_second_process_keeps_in_flight_work(tmp_path):
+    first = ArtifactStore(str(tmp_path))
+    exported = _export(first, "deck.pdf", b"pdf")
+    stale = tmp_path / "objects" / "stale"
+    stale.mkdir()
+    old = time.time() - artifact_store.ORPHAN_GRACE_S - 1
+    os.utime(stale, (old, old))
+
+    ArtifactStore(str(tmp_path))
+
+    assert os.path.exists(exported)
+    assert not stale.exists()
+    assert first.put("a", "pdf", [exported])
+
+
+def test_processes_share_one_index(tmp_path):
+    first = ArtifactStore(str(tmp_path))
+    second = ArtifactStore(str(tmp_path))
+    blobs = first.put("a", "pdf", [_export(first, "a.pdf", b"a")])
+    second.put("b", "pdf", [_export(second, "b.pdf", b"b")])
+
+    assert first.lookup("b") is not None
+    assert second.put("a", "pdf", [_export(second, "a.pdf", b"a")]) == blobs
+    assert first.stats()["entries"] == second.stats()["entries"] == 2
+
+
+def test_eviction_sees_every_process_entries(tmp_path):
+    first = ArtifactStore(str(tmp_path), max_bytes=15)
+    second = ArtifactStore(str(tmp_path), max_bytes=15)
+    first.put("a", "pdf", [_export(first, "a.pdf", b"a" * 10)])
+    second.put("b", "pdf", [_export(second, "b.pdf", b"b" * 10)])
+
+    assert first.lookup("a") is None
+    assert second.stats()["bytes"] == 10
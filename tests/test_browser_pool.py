@@ -0,0 +1,47 @@
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from browser_pool import BrowserPool, _PooledBrowser
+
+
+class HangingContext:
+    async def new_page(self):
+        return object()
+
+    async def close(self):
+        await asyncio.Event().wait()
+
+
+class FakeBrowser:
+    async def new_context(self, **options):
+        return HangingContext()
+
+    def is_connected(self):
+        return True
+
+
+def test_cancelled_close_still_returns_the_slot():
+    async def main():
+        pool = BrowserPool(size=1, pages_per_browser=1, max_memory_mb=0)
+        pool._playwright = object()
+        pool._capacity = asyncio.Semaphore(1)
+        slot = pool._slots[0] = _PooledBrowser(FakeBrowser())
+        entered = asyncio.Event()
+
+        async def use():
+            async with pool.lease():
+                entered.set()
+                await asyncio.Event().wait()
+
+        task = asyncio.create_task(use())
+        await entered.wait()
+        task.cancel()
+        await asyncio.sleep(0)
+        # The lease is now closing its context; cancel it again.
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return slot.active, pool._capacity.locked()
+
+    assert asyncio.run(main()) == (0, False)
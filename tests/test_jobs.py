@@ -0,0 +1,45 @@
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from jobs import JobManager
+
+
+def test_unfinished_jobs_are_taken_over_only_from_gone_servers(tmp_path):
+    started = []
+    release = None
+
+    async def runner(params, progress):
+        started.append(params["title"])
+        await release.wait()
+        return ["✅ done"], {}
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        first = JobManager(runner, str(tmp_path))
+        job = await first.submit({"title": "deck", "content": "# x"})
+        await asyncio.sleep(0.05)
+
+        second = JobManager(runner, str(tmp_path))
+        await second.start()
+        await asyncio.sleep(0.05)
+        assert started == ["deck"]
+        assert second.get(job["id"])["status"] == "running"
+
+        # The first server goes away with the job unfinished; a new one takes it over.
+        await first.close()
+        third = JobManager(runner, str(tmp_path))
+        await third.start()
+        await asyncio.sleep(0.05)
+        assert started == ["deck", "deck"]
+
+        release.set()
+        finished = await second.wait(job["id"], 5)
+        assert finished["status"] == "succeeded"
+        assert "content" not in finished["params"]
+        await second.close()
+        await third.close()
+
+    asyncio.run(main())
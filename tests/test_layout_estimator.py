@@ -0,0 +1,118 @@
+import os
+import sys
+import asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import EngineSplitter
+from layout_estimator import (
+    PREV_KINDS, TARGET_KINDS, CalibrationStore, LayoutEstimator, calibration_deck, chunk_kind, fit_calibration
+)
+from benchmarks.stubs import LINE_HEIGHT, StubBrowserPool, StubRenderer
+
+
+def kinds(text):
+    chunks = EngineSplitter()._safe_chunk_text(text)
+    return [chunk_kind(chunks, idx) for idx in range(len(chunks))]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("# Title", [("h1", True)]),
+    ("## Sub\nbody under it", [("p", False)]),
+    ("Plain paragraph\nsecond line", [("p", True)]),
+    ("para with $x$ math", [("p", False)]),
+    ("1. one\n2. two", [("li0", True), ("li0", True)]),
+    ("- a\n- b\n  - c", [("li0", True), ("li0", False), ("li1", False)]),
+    ("- a\n\n- b", [("li0", True), ("li0", False)]),
+    ("> quote", [(None, False)]),
+    ("<div>x</div>", [(None, False)]),
+    ("Setext\n===", [(None, False)]),
+    ("***", [(None, False)]),
+    ("```\ncode\n```", [("code", False)]),
+    ("$$\nx\n$$", [("math", False)]),
+    ("| a | b |\n|---|---|\n| 1 | 2 |", [("table", False), ("table", False)]),
+])
+def test_chunk_kind(text, expected):
+    assert kinds(text) == expected
+
+
+def estimator(transform="none"):
+    # With WIDTH_SLACK every ASCII glyph is 10.5 px and a wide glyph 21 px, in a 100 px box.
+    return LayoutEstimator({
+        "kinds": {"p": {"width": 100.0, "ascii": [10.0] * 95, "wide": 20.0, "line": 30.0, "transform": transform}},
+        "transitions": {"start>p": 40.0, "p>p": 50.0},
+    })
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("", 1),
+    ("abcd efgh", 1),
+    ("abcd efgh ijkl", 2),
+    # An unbreakable word wider than the box overflows onto extra lines.
+    ("a" * 25, 3),
+    ("ab " + "a" * 25, 4),
+    # Wide glyphs break anywhere: four fit on a line.
+    ("中" * 4, 1),
+    ("中" * 10, 3),
+    ("abcd中中中", 2),
+])
+def test_line_count(line, expected):
+    assert estimator().line_count("p", line) == expected
+
+
+def test_uppercase_transform_is_applied():
+    assert estimator(transform="uppercase").line_count("p", "abcd efgh") == 1
+
+
+def test_delta_adds_lines_to_the_transition():
+    model = estimator()
+    assert model.delta("p", "start", "abcd efgh") == 40.0
+    assert model.delta("p", "p", "abcd efgh ijkl\n[link](http://x) **bold**") == 50.0 + 2 * 30.0
+
+
+def test_fit_calibration_recovers_transitions_and_line_heights():
+    chunks, windows, layout = calibration_deck(EngineSplitter()._safe_chunk_text)
+    transition = {f"{prev}>{kind}": 10.0 + n for n, (prev, kind) in
+                  enumerate((prev, kind) for prev in PREV_KINDS for kind in TARGET_KINDS)}
+    line = {kind: 20.0 + n for n, kind in enumerate(TARGET_KINDS)}
+    ys = {}
+    for window in layout:
+        first, second, third = window["targets"]
+        # A window without a previous sample starts at the top of its slide.
+        base = 0.0 if window["prev_idx"] is None else 1000.0 * len(ys)
+        if window["prev_idx"] is not None:
+            ys[window["prev_idx"]] = base
+        step = transition[f"{window['kind']}>{window['kind']}"]
+        ys[first] = base + transition[f"{window['prev']}>{window['kind']}"]
+        ys[second] = ys[first] + step
+        ys[third] = ys[second] + step + 2 * line[window["kind"]]
+    metrics = {str(idx): {"width": 500.0, "ascii": [8.0] * 95, "wide": 16.0, "transform": "none"} for idx in ys}
+    measured = {"probes": [{"idx": idx, "y": y} for idx, y in ys.items()], "calibration": metrics}
+
+    calibration = fit_calibration(layout, measured, 600.0)
+    assert calibration["transitions"] == transition
+    assert {kind: calibration["kinds"][kind]["line"] for kind in TARGET_KINDS} == line
+    assert calibration["usableHeight"] == 600.0
+
+
+def test_calibration_on_the_stub_page(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+
+    async def calibrate():
+        return await EngineSplitter()._calibrate("default", "marp", {}, StubBrowserPool(), StubRenderer())
+
+    calibration = asyncio.run(calibrate())
+    assert set(calibration["transitions"]) == {f"{prev}>{kind}" for prev in PREV_KINDS for kind in TARGET_KINDS}
+    for kind in TARGET_KINDS:
+        assert calibration["kinds"][kind]["line"] == LINE_HEIGHT
+        assert calibration["kinds"][kind]["width"] > 0
+
+
+@pytest.mark.parametrize("value, enabled", [(None, False), ("0", False), ("1", True), ("yes", False)])
+def test_store_only_enabled_by_one(monkeypatch, value, enabled):
+    if value is None:
+        monkeypatch.delenv("MARP_LAYOUT_ESTIMATOR", raising=False)
+    else:
+        monkeypatch.setenv("MARP_LAYOUT_ESTIMATOR", value)
+    assert (CalibrationStore.from_env() is not None) == enabled
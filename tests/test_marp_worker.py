@@ -0,0 +1,56 @@
+"""
+Checks the Marp worker's export render against the marp CLI it replaces. Needs
+Node with the packages from package.json installed, so it is skipped elsewhere.
+"""
+import os
+import re
+import sys
+import asyncio
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from marp_renderer import MarpRenderer
+
+MARP_CLI = os.path.join(ROOT, "node_modules", ".bin", "marp")
+SCRIPT_RE = re.compile(r"<script\b[^>]*>.*?</script>", re.DOTALL)
+
+# Content that only looks like the CLI's output once marp-core's browser script has run.
+DECK = """# <!-- fit --> A fitted heading that marp-core scales to the slide width
+
+```
+a very wide line of code that does not fit on the slide and is shrunk to its width, not overflowing it
+```
+
+---
+
+$$
+\\sum_{i=1}^{n} i = \\frac{n(n+1)}{2} + \\sum_{i=1}^{n} i^2 + \\sum_{i=1}^{n} i^3 + \\sum_{i=1}^{n} i^4 + \\sum_{i=1}^{n} i^5
+$$
+"""
+
+renderer = MarpRenderer.discover(ROOT)
+pytestmark = pytest.mark.skipif(
+    renderer is None or not os.path.exists(MARP_CLI), reason="needs node and the marp packages in node_modules"
+)
+
+
+def test_export_render_matches_cli(tmp_path):
+    async def render():
+        try:
+            return await renderer.render(DECK, inline_svg=True, script=True)
+        finally:
+            await renderer.close()
+
+    rendered = asyncio.run(render())
+    md_file = tmp_path / "deck.md"
+    md_file.write_text(DECK, encoding="utf-8")
+    subprocess.run([MARP_CLI, str(md_file), "-o", str(tmp_path / "deck.html")], check=True, cwd=ROOT)
+    cli_html = (tmp_path / "deck.html").read_text(encoding="utf-8")
+
+    scripts = SCRIPT_RE.findall(rendered["html"])
+    assert scripts, "the export render must carry marp-core's browser script"
+    assert all(script in cli_html for script in scripts)
+    assert SCRIPT_RE.sub("", rendered["html"]) in SCRIPT_RE.sub("", cli_html)
@@ -0,0 +1,18 @@
+import os
+import sys
+import sqlite3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from measure_cache import HeightCache
+
+
+def test_put_many_persists_every_block(tmp_path):
+    db = str(tmp_path / "heights.db")
+    cache = HeightCache(db_path=db)
+    cache.put_many([("a", [1.0, 2.0]), ("b", [3.0])])
+    cache.put("c", (4.0,))
+
+    reopened = HeightCache(db_path=db)
+    assert [reopened.get(key) for key in "abc"] == [[1.0, 2.0], [3.0], [4.0]]
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM heights").fetchone()[0] == 3
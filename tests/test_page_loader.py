@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from page_loader import VIRTUAL_ORIGIN, serve_file_urls
+
+
+def test_loaded_resources_move_onto_the_origin():
+    html = (
+        '<style>section { background: url("file:///t/b.png"); }</style>'
+        '<img src="file:///t/a.png"><img srcset="file:///t/a.png 1x, file://localhost/t/a2.png 2x">'
+        "<video poster='file:///t/p.png' src=file:///t/v.mp4></video>"
+        '<link rel="stylesheet" href="FILE:///t/s.css">'
+        '<figure style="background-image:url(&quot;file:///t/bg.jpg&quot;);"></figure>'
+        '<svg><image xlink:href="file:///t/i.png"/></svg>'
+    )
+    out = serve_file_urls(html)
+    assert "file:" not in out.lower()
+    for path in ("/t/b.png", "/t/a.png", "/t/a2.png", "/t/p.png", "/t/v.mp4", "/t/s.css", "/t/bg.jpg", "/t/i.png"):
+        assert VIRTUAL_ORIGIN + path in out
+
+
+def test_slide_text_and_links_are_left_as_written():
+    html = (
+        "<p>See the report (file:///home/me/r.pdf) and <code>open('file:///etc/hosts')</code></p>"
+        '<p>src="file:///text"</p><a href="file:///t/doc.pdf">doc</a><img src="a.png" alt="(file:///x)">'
+    )
+    assert serve_file_urls(html) == html
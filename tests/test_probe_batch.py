@@ -0,0 +1,111 @@
+import os
+import re
+import sys
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import FUSED_MEASURE_JS, MEASURE_JS
+from probe_batch import ProbeBatcher, fused_document
+
+HOST_RE = re.compile(r'<div data-marp-deck="(\d+)"><template shadowrootmode="open">(.*?)</template></div>', re.DOTALL)
+SCRIPT = "<script>/* marp-core browser */</script>"
+
+
+def deck(css, html):
+    return {"css": css, "html": html, "comments": []}
+
+
+def test_fused_document_isolates_decks_and_hoists_fonts_and_script():
+    doc = fused_document([
+        deck("@font-face{font-family:a;src:url(a.woff)}section{color:red}", f"<section>A</section>{SCRIPT}"),
+        deck("@import url('b.css');@font-face{font-family:a;src:url(a.woff)}section{color:blue}",
+             f"<section>B</section>{SCRIPT}"),
+    ])
+    head, body = doc.split("</head>")
+    # @import must open the stylesheet; the shared @font-face is kept once.
+    assert "<style>@import url('b.css');@font-face{font-family:a;src:url(a.woff)}</style>" in head
+    hosts = HOST_RE.findall(body)
+    assert hosts == [
+        ("0", "<style>section{color:red}</style><section>A</section>"),
+        ("1", "<style>section{color:blue}</style><section>B</section>"),
+    ]
+    assert body.count(SCRIPT) == 1 and body.rindex(SCRIPT) > body.rindex("</template>")
+
+
+def test_fused_measure_script_keys_results_by_host():
+    # The fused result maps each host's data-marp-deck (dataset.marpDeck) to its measurement.
+    assert "querySelectorAll('[data-marp-deck]')" in FUSED_MEASURE_JS
+    assert "host.dataset.marpDeck" in FUSED_MEASURE_JS
+
+
+class HostPage:
+    """Answers the measurement scripts from the document markup, one distinct result per deck."""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def route(self, pattern, handler):
+        self.handler = handler
+
+    async def goto(self, url):
+        route = type("Route", (), {"request": type("Request", (), {"url": url})()})()
+
+        async def fulfill(body="", **kwargs):
+            self.documents.append(body)
+        route.fulfill = fulfill
+        await self.handler(route)
+
+    async def evaluate(self, script, *args):
+        if script is FUSED_MEASURE_JS:
+            hosts = HOST_RE.findall(self.documents[-1])
+            return {n: {"probes": [{"idx": 0, "y": float(len(html))}]} for n, html in hosts}
+        if script is MEASURE_JS:
+            return {"probes": [{"idx": 0, "y": -1.0}]}
+        return {"waitedOn": [], "signals": {}, "elapsedMs": 0, "timedOut": False}
+
+
+class HostPool:
+    def __init__(self):
+        self.documents = []
+
+    @asynccontextmanager
+    async def lease(self):
+        yield HostPage(self.documents)
+
+
+def test_each_caller_gets_its_own_deck_result():
+    pool = HostPool()
+    decks = [deck("", f'<section><span class="m-probe"></span>{"x" * n}</section>') for n in (1, 20, 300)]
+
+    async def main():
+        batcher = ProbeBatcher(pool, window_ms=20)
+        return await asyncio.gather(*(batcher.measure(rendered) for rendered in decks)), batcher.stats()
+
+    results, stats = asyncio.run(main())
+    assert stats == {"pages": 1, "probes": 3}
+    hosts = dict(HOST_RE.findall(pool.documents[0]))
+    for n, (result, _) in enumerate(results):
+        assert result == {"probes": [{"idx": 0, "y": float(len(hosts[str(n)]))}]}
+
+
+def test_single_probe_uses_the_plain_document():
+    pool = HostPool()
+
+    async def main():
+        return await ProbeBatcher(pool, window_ms=1).measure(deck("", '<span class="m-probe"></span>'))
+
+    result, _ = asyncio.run(main())
+    assert result == {"probes": [{"idx": 0, "y": -1.0}]}
+    assert "data-marp-deck" not in pool.documents[0]
+
+
+@pytest.mark.parametrize("value, enabled", [(None, False), ("0", False), ("1", True), ("on", False)])
+def test_fusion_only_enabled_by_one(monkeypatch, value, enabled):
+    if value is None:
+        monkeypatch.delenv("MARP_PROBE_FUSION", raising=False)
+    else:
+        monkeypatch.setenv("MARP_PROBE_FUSION", value)
+    assert (ProbeBatcher.from_env(HostPool()) is not None) == enabled